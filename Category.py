@@ -59,7 +59,6 @@ category_keywords = {
     'sip': 'Investment',
 }
 
-# If you prefer external (JSON) configuration, uncomment below:
-# import json
-# with open('category_mapping.json', 'r') as f:
-#     category_keywords = json.load(f)
+# For external (JSON/YAML) configuration, create category_mapping.json next to this file
+# (see category_mapping.example.json). category_matching reloads it automatically when it
+# changes; this mapping is used whenever no such file exists.
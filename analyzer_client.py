@@ -0,0 +1,110 @@
+# Thin HTTP client for the analysis service (service.py)
+import time
+from datetime import datetime
+
+import requests
+
+from benchmarks import PercentileTable
+
+POLL_INTERVAL = 0.5  # seconds
+JOB_TIMEOUT = 300  # seconds
+
+
+class AnalysisServiceError(Exception):
+    """Raised when the analysis service rejects a job or the job fails."""
+
+
+def _check(response):
+    if response.status_code >= 400:
+        try:
+            detail = response.json().get("detail", response.text)
+        except ValueError:
+            detail = response.text
+        raise AnalysisServiceError(f"{response.status_code}: {detail}")
+    return response.json()
+
+
+def submit_statement(service_url, pdf_bytes, api_key=None, user_id=None, contribute_benchmarks=True):
+    """Queue a statement for parsing and analysis. Returns the job id."""
+    headers = {"Content-Type": "application/pdf"}
+    if api_key:
+        headers["X-Gemini-Api-Key"] = api_key
+    if user_id:
+        headers["X-User-Id"] = user_id
+    if not contribute_benchmarks:
+        headers["X-Skip-Benchmarks"] = "1"
+    response = requests.post(f"{service_url}/jobs", data=pdf_bytes, headers=headers, timeout=30)
+    return _check(response)["job_id"]
+
+
+def get_job_status(service_url, job_id):
+    return _check(requests.get(f"{service_url}/jobs/{job_id}", timeout=10))
+
+
+def get_job_result(service_url, job_id):
+    result = _check(requests.get(f"{service_url}/jobs/{job_id}/result", timeout=30))
+    # JSON carries timestamps as ISO strings; restore the datetimes the parsers produce
+    for transaction in result["transactions"] or []:
+        if transaction.get("Parsed_Date"):
+            transaction["Parsed_Date"] = datetime.fromisoformat(transaction["Parsed_Date"])
+    return result
+
+
+def get_benchmarks(service_url):
+    """Peer percentile tables from the service as {category: PercentileTable}."""
+    try:
+        data = _check(requests.get(f"{service_url.rstrip('/')}/benchmarks", timeout=10))
+    except requests.RequestException as e:
+        raise AnalysisServiceError(f"Could not reach analysis service: {e}") from e
+    return {category: PercentileTable.from_dict(table) for category, table in data["categories"].items()}
+
+
+def submit_benchmark_upload(service_url, job_ids):
+    """Have the service contribute several statement jobs, uploaded together, to the peer benchmarks once."""
+    try:
+        response = requests.post(f"{service_url.rstrip('/')}/benchmarks/uploads",
+                                 json={"job_ids": list(job_ids)}, timeout=30)
+        return _check(response)["accepted"]
+    except requests.RequestException as e:
+        raise AnalysisServiceError(f"Could not reach analysis service: {e}") from e
+
+
+def wait_for_job(service_url, job_id, timeout=JOB_TIMEOUT, poll_interval=POLL_INTERVAL):
+    """Poll until the job finishes. Returns the final status payload."""
+    deadline = time.monotonic() + timeout
+    while True:
+        status = get_job_status(service_url, job_id)
+        if status["status"] == "done":
+            return status
+        if status["status"] == "failed":
+            raise AnalysisServiceError(status.get("error") or "Job failed")
+        if time.monotonic() > deadline:
+            raise AnalysisServiceError(f"Job {job_id} did not finish within {timeout}s")
+        time.sleep(poll_interval)
+
+
+def analyze_statement_remote(service_url, pdf_bytes, api_key=None, user_id=None, timeout=JOB_TIMEOUT,
+                             contribute_benchmarks=True):
+    """Submit a statement, wait for it and return the job result."""
+    service_url = service_url.rstrip("/")
+    try:
+        job_id = submit_statement(service_url, pdf_bytes, api_key, user_id, contribute_benchmarks)
+        wait_for_job(service_url, job_id, timeout)
+        return get_job_result(service_url, job_id)
+    except requests.RequestException as e:
+        raise AnalysisServiceError(f"Could not reach analysis service: {e}") from e
+
+
+def analyze_text_remote(service_url, text, api_key, timeout=JOB_TIMEOUT):
+    """Generate a report on the service from already parsed transaction text."""
+    service_url = service_url.rstrip("/")
+    try:
+        response = requests.post(f"{service_url}/reports", data=text.encode("utf-8"),
+                                 headers={"Content-Type": "text/plain; charset=utf-8",
+                                          "X-Gemini-Api-Key": api_key},
+                                 timeout=30)
+        job_id = _check(response)["job_id"]
+        wait_for_job(service_url, job_id, timeout)
+        return get_job_result(service_url, job_id)["report"]
+    except requests.RequestException as e:
+        raise AnalysisServiceError(f"Could not reach analysis service: {e}") from e
@@ -0,0 +1,316 @@
+# Anonymized peer benchmarks of monthly spend per category
+#
+# Every upload contributes its average monthly debit total per category to a
+# KLL quantile sketch for that category. Sketches keep O(k) values no
+# matter how many users contribute, merge without loss of their error
+# guarantee (so parse worker processes can each build a partial sketch), and
+# carry no user ids: only the amounts. A category is only published once
+# enough separate statements have contributed to it, and the published table
+# never includes the exact extremes. A 101-entry percentile table is built
+# once per sketch change, so "which percentile is this amount" is a fixed
+# size lookup.
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from forecasting import spending_matrix
+
+DEFAULT_K = 200  # sketch accuracy: rank error is roughly 1.65 / k
+MIN_CAPACITY = 2
+CAPACITY_DECAY = 2 / 3
+MIN_CONTRIBUTORS = 20  # categories with fewer contributing statements are not reported, for anonymity
+TAIL_PERCENTILE = 5  # table entries below the 5th / above the 95th percentile are clamped to them
+MAX_PARTIAL_CATEGORIES = 200  # categories one upload may contribute to
+MAX_CATEGORY_LENGTH = 100
+MAX_CATEGORIES = 1000  # sketches kept by a store; new categories beyond this are not pooled
+MAX_SEEN_STATEMENTS = 10000  # recent statement digests kept to ignore re-uploads
+STORE_FORMAT = 2  # 2: one mean monthly value per upload and category (1 held one value per month)
+PERCENTILES = np.arange(101)
+
+DEFAULT_BENCHMARK_PATH = os.environ.get("UPI_BENCHMARK_PATH")
+
+
+class PercentileTable:
+    """Values at the 0th..100th percentile of a distribution."""
+
+    def __init__(self, values, count):
+        self.values = np.asarray(values, dtype=float)
+        self.count = count
+
+    def percentile(self, amount):
+        """Percentile (0-100) of `amount` within the distribution."""
+        values = self.values
+        lo = int(np.searchsorted(values, amount, side="left"))
+        hi = int(np.searchsorted(values, amount, side="right"))
+        if lo < hi:
+            # Amount equals one or more table entries (e.g. many users spend 0): take the middle
+            return (lo + hi - 1) / 2
+        if lo == 0:
+            return 0.0
+        if lo == len(values):
+            return 100.0
+        below, above = values[lo - 1], values[lo]
+        return lo - 1 + (amount - below) / (above - below)
+
+    def to_dict(self):
+        return {"count": self.count, "percentiles": self.values.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["percentiles"], data["count"])
+
+
+class KLLSketch:
+    """Mergeable streaming quantile sketch (Karnin, Lang & Liberty).
+
+    Level h holds values that each stand for 2**h inputs. When the sketch
+    outgrows its budget the lowest full level is sorted and every other
+    value (random offset) is promoted one level up, which halves it while
+    keeping ranks unbiased. Lower levels get geometrically smaller
+    capacities, so total size stays about k / (1 - 2/3) values.
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=None):
+        self.k = k
+        self.levels = [[]]
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._rng = random.Random(seed)
+        self._table = None
+
+    def __len__(self):
+        return self.count
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(MIN_CAPACITY, int(math.ceil(self.k * CAPACITY_DECAY ** depth)))
+
+    def _over_budget(self):
+        return sum(map(len, self.levels)) > sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def _compress(self):
+        while self._over_budget():
+            level = next(h for h in range(len(self.levels)) if len(self.levels[h]) >= self._capacity(h))
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            items = sorted(self.levels[level])
+            # An odd item out stays behind, so every promoted pair keeps the total weight exact
+            leftover = [items.pop()] if len(items) % 2 else []
+            self.levels[level + 1].extend(items[self._rng.randint(0, 1)::2])
+            self.levels[level] = leftover
+
+    def update(self, value):
+        value = float(value)
+        self.levels[0].append(value)
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self._table = None
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other):
+        """Fold another sketch into this one."""
+        if other.count == 0:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._table = None
+        self._compress()
+        return self
+
+    def percentile_table(self):
+        """PercentileTable for the current contents, cached until the next update."""
+        if self._table is None:
+            values = np.concatenate([np.asarray(items, dtype=float) for items in self.levels])
+            weights = np.concatenate([np.full(len(items), 2.0 ** h) for h, items in enumerate(self.levels)])
+            order = np.argsort(values, kind="stable")
+            values, weights = values[order], weights[order]
+            # Interpolate between the rank midpoints of neighbouring values, so a published
+            # percentile is a blend of contributions rather than one person's exact figure
+            centers = np.cumsum(weights) - weights / 2
+            table = np.interp(PERCENTILES / 100 * weights.sum(), centers, values)
+            # The outer percentiles of a small population are single people's exact extremes; clamp them
+            table = np.clip(table, table[TAIL_PERCENTILE], table[100 - TAIL_PERCENTILE])
+            self._table = PercentileTable(np.maximum.accumulate(table), self.count)
+        return self._table
+
+    def to_dict(self):
+        return {"k": self.k, "count": self.count, "min": self.min, "max": self.max, "levels": self.levels}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data.get("k", DEFAULT_K))
+        sketch.levels = [list(map(float, items)) for items in data["levels"]] or [[]]
+        sketch.count = int(data["count"])
+        values = [v for items in sketch.levels for v in items]
+        sketch.min = float(data.get("min", min(values, default=math.inf))) if sketch.count else math.inf
+        sketch.max = float(data.get("max", max(values, default=-math.inf))) if sketch.count else -math.inf
+        return sketch
+
+
+def average_monthly_spend(transactions):
+    """{category: mean monthly debit total}, the figure pooled and compared against peers.
+
+    Months inside the statement period without spend in a category count as zero.
+    """
+    categories, _, matrix = spending_matrix(transactions)
+    return dict(zip(categories, matrix.mean(axis=1))) if categories else {}
+
+
+def statement_sketches(transactions, k=DEFAULT_K):
+    """Partial sketches for one upload: {category: sketch dict} of its mean monthly spend.
+
+    Each upload adds a single value per category, the same figure
+    compare_to_peers() ranks users by, so a long statement does not weigh
+    more than a short one. The result is plain data, so a parse worker
+    process can return it for the service to merge.
+    """
+    partial = {}
+    for category, amount in average_monthly_spend(transactions).items():
+        sketch = KLLSketch(k)
+        sketch.update(amount)
+        partial[category] = sketch.to_dict()
+    return partial
+
+
+def validate_partial(partial):
+    """Raise ValueError unless `partial` looks like statement_sketches() output.
+
+    Every category must hold exactly one value at level 0: one upload's
+    figure. Anything heavier would let a single contribution outweigh others.
+    """
+    if not isinstance(partial, dict) or len(partial) > MAX_PARTIAL_CATEGORIES:
+        raise ValueError(f"sketches must be an object of at most {MAX_PARTIAL_CATEGORIES} categories")
+    for category, data in partial.items():
+        if not isinstance(category, str) or not category or len(category) > MAX_CATEGORY_LENGTH:
+            raise ValueError(f"Invalid category name {category!r}")
+        try:
+            levels = data["levels"]
+            values = [float(v) for v in levels[0]]
+            count = int(data["count"])
+            higher = any(len(items) for items in levels[1:])
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise ValueError(f"Malformed sketch for {category!r}")
+        if count != 1 or len(values) != 1 or higher:
+            raise ValueError(f"Sketch for {category!r} must hold exactly one value")
+        if not all(math.isfinite(v) and v >= 0 for v in values):
+            raise ValueError(f"Sketch for {category!r} has invalid amounts")
+
+
+class BenchmarkStore:
+    """Population sketches per category, optionally persisted as JSON."""
+
+    def __init__(self, path=DEFAULT_BENCHMARK_PATH, k=DEFAULT_K):
+        self.path = path
+        self.k = k
+        self.sketches = {}
+        self.contributors = {}  # category -> number of statements merged into its sketch
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_partial(self, partial, digest=None):
+        """Merge statement_sketches() output. Returns False if `digest` was already counted.
+
+        Raises ValueError for a partial that fails validate_partial().
+        """
+        validate_partial(partial)
+        with self._lock:
+            if digest is not None:
+                if digest in self._seen:
+                    return False
+                self._seen[digest] = None
+                if len(self._seen) > MAX_SEEN_STATEMENTS:
+                    self._seen.popitem(last=False)
+            for category, data in partial.items():
+                if category not in self.sketches and len(self.sketches) >= MAX_CATEGORIES:
+                    continue
+                self.sketches.setdefault(category, KLLSketch(self.k)).merge(KLLSketch.from_dict(data))
+                self.contributors[category] = self.contributors.get(category, 0) + 1
+        return True
+
+    def ingest(self, transactions, digest=None):
+        return self.add_partial(statement_sketches(transactions, self.k), digest)
+
+    def tables(self, min_contributors=MIN_CONTRIBUTORS):
+        """{category: PercentileTable} for categories with enough contributing statements.
+
+        The threshold counts statements, not monthly values, so one long
+        statement cannot make a category public on its own.
+        """
+        with self._lock:
+            return {category: sketch.percentile_table() for category, sketch in self.sketches.items()
+                    if self.contributors.get(category, 0) >= min_contributors}
+
+    def _to_dict(self):
+        return {
+            "format": STORE_FORMAT,
+            "k": self.k,
+            "sketches": {category: sketch.to_dict() for category, sketch in self.sketches.items()},
+            "contributors": dict(self.contributors),
+            "seen": list(self._seen),
+        }
+
+    def to_dict(self):
+        with self._lock:
+            return self._to_dict()
+
+    def save(self):
+        """Write the store atomically; concurrent sessions serialize on the store's lock."""
+        if not self.path:
+            return
+        with self._lock:
+            fd, temp_path = tempfile.mkstemp(prefix=".benchmarks-", dir=os.path.dirname(os.path.abspath(self.path)))
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(self._to_dict(), f)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+
+    @classmethod
+    def load(cls, path=DEFAULT_BENCHMARK_PATH, k=DEFAULT_K):
+        store = cls(path, k)
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") != STORE_FORMAT:
+                # Older stores pooled a different statistic; start over rather than mix the two
+                return store
+            store.k = data.get("k", k)
+            store.sketches = {category: KLLSketch.from_dict(sketch) for category, sketch in data["sketches"].items()}
+            store.contributors = dict(data.get("contributors", {}))
+            store._seen = OrderedDict.fromkeys(data.get("seen", []))
+        return store
+
+
+def compare_to_peers(transactions, tables):
+    """Rows of (Category, Your Monthly Spend, Peer Percentile, Peer Median) for benchmarked categories."""
+    rows = []
+    for category, amount in average_monthly_spend(transactions).items():
+        table = tables.get(category)
+        if table is not None:
+            rows.append({
+                "Category": category,
+                "Your Monthly Spend": amount,
+                "Peer Percentile": round(table.percentile(amount)),
+                "Peer Median": table.values[50],
+            })
+    return rows
+
+
+# Shared by every session of this process, like category_matching.category_mapping
+population = BenchmarkStore.load()
@@ -0,0 +1,223 @@
+# Hot-reloadable keyword → category matching
+#
+# The mapping is read from category_mapping.json (or the file named by
+# UPI_CATEGORY_MAPPING, JSON or YAML) and falls back to Category.py when no
+# file exists. The file is checked on every get_matcher() call: a changed
+# mtime triggers a content hash, and only a changed hash rebuilds the
+# compiled matchers. See category_mapping.example.json for the format.
+import hashlib
+import json
+import os
+import re
+import threading
+
+import streamlit as st
+
+from Category import category_keywords
+
+DEFAULT_MAPPING_PATH = os.environ.get(
+    "UPI_CATEGORY_MAPPING",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "category_mapping.json"),
+)
+DEFAULT_CATEGORY = "Other"
+
+
+class CategoryMatcher:
+    """Compiled matcher for an ordered list of (keyword, category) rules.
+
+    The first rule (highest priority) whose keyword occurs in the text wins,
+    which is the same rule the parsers used when looping over
+    category_keywords. A single regex with a lookahead alternation finds
+    every keyword occurrence in one pass over the text.
+    """
+
+    def __init__(self, rules, version="builtin"):
+        self.rules = []
+        self.rank = {}
+        self.category = {}
+        for keyword, category in rules:
+            keyword = keyword.lower()
+            # Rules arrive in priority order, so the first rule for a keyword decides its category
+            if keyword and keyword not in self.rank:
+                self.rank[keyword] = len(self.rules)
+                self.rules.append(keyword)
+                self.category[keyword] = category
+        self.version = version
+        self._pattern = _compile(self.rules)
+
+    def match(self, text):
+        """Return (category, matched_keyword); keyword is None when nothing matched."""
+        if self._pattern is None or not text:
+            return DEFAULT_CATEGORY, None
+        best = None
+        for m in self._pattern.finditer(text.lower()):
+            rank = self.rank[m.group(1)]
+            if best is None or rank < best:
+                best = rank
+                if rank == 0:
+                    break
+        if best is None:
+            return DEFAULT_CATEGORY, None
+        keyword = self.rules[best]
+        return self.category[keyword], keyword
+
+    def categorize(self, text):
+        return self.match(text)[0]
+
+    def changed_keywords(self, other):
+        """Keywords whose outcome may differ between `other` and this matcher.
+
+        Returns None when keywords present in both were reordered, in which
+        case every row has to be re-evaluated.
+        """
+        changed = {k for k in self.category.keys() | other.category.keys()
+                   if self.category.get(k) != other.category.get(k)}
+        kept_before = [k for k in other.rules if k in self.rank and k not in changed]
+        kept_after = [k for k in self.rules if k in other.rank and k not in changed]
+        if kept_before != kept_after:
+            return None
+        return changed
+
+
+def _compile(keywords):
+    if not keywords:
+        return None
+    return re.compile("(?=(" + "|".join(re.escape(k) for k in keywords) + "))")
+
+
+def _parse_rules(keywords=None, rules=None):
+    """Order a {keyword: category} dict plus a list of rule dicts by priority.
+
+    Dict entries have priority 0. Higher priority comes first and file
+    order breaks ties, so a plain dict keeps its original order.
+    """
+    entries = [{"keyword": k, "category": c} for k, c in (keywords or {}).items()] + list(rules or [])
+    ordered = sorted(enumerate(entries), key=lambda item: (-float(item[1].get("priority", 0)), item[0]))
+    return [(rule["keyword"], rule["category"]) for _, rule in ordered]
+
+
+def _is_flat_mapping(config):
+    return isinstance(config, dict) and all(isinstance(v, str) for v in config.values())
+
+
+class CategoryMapping:
+    """Loads the mapping file and caches one compiled matcher per user."""
+
+    def __init__(self, path=DEFAULT_MAPPING_PATH, defaults=category_keywords):
+        self.path = path
+        self.defaults = defaults
+        self._mtime = None
+        self._digest = None
+        self._global_rules = _parse_rules(defaults)
+        self._user_rules = {}
+        self._matchers = {}
+        # Every Streamlit session thread shares this mapping
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._digest or "builtin"
+
+    def _load(self, raw):
+        if self.path.endswith((".yaml", ".yml")):
+            import yaml
+            config = yaml.safe_load(raw)
+        else:
+            config = json.loads(raw)
+
+        if _is_flat_mapping(config):
+            return _parse_rules(config), {}
+        global_rules = _parse_rules(config.get("keywords"), config.get("rules"))
+        user_rules = {
+            str(user_id): _parse_rules(overrides.get("keywords"), overrides.get("rules"))
+            for user_id, overrides in (config.get("users") or {}).items()
+        }
+        return global_rules, user_rules
+
+    def refresh(self):
+        """Reload the mapping if the file changed. Returns True when matchers were rebuilt."""
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+
+        if mtime is None:
+            if self._digest is None:
+                return False
+            # File was removed: fall back to the built-in mapping
+            self._digest = None
+            self._global_rules, self._user_rules = _parse_rules(self.defaults), {}
+            self._matchers.clear()
+            return True
+
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        if digest == self._digest:
+            return False
+        try:
+            self._global_rules, self._user_rules = self._load(raw)
+        except Exception as e:
+            st.warning(f"Ignoring invalid category mapping {self.path}: {e}", icon="⚠️")
+            return False
+        self._digest = digest
+        self._matchers.clear()
+        return True
+
+    def matcher(self, user_id=None):
+        with self._lock:
+            self._refresh()
+            key = str(user_id) if user_id is not None and str(user_id) in self._user_rules else None
+            if key not in self._matchers:
+                rules = self._global_rules
+                if key is not None:
+                    # User overrides take precedence over every global rule
+                    overrides = self._user_rules[key]
+                    overridden = {k.lower() for k, _ in overrides}
+                    rules = overrides + [(k, c) for k, c in rules if k.lower() not in overridden]
+                version = self.version if key is None else f"{self.version}:{key}"
+                self._matchers[key] = CategoryMatcher(rules, version)
+            return self._matchers[key]
+
+
+category_mapping = CategoryMapping()
+
+
+def get_matcher(user_id=None):
+    """Current compiled matcher for a user, rebuilt only if the mapping file changed."""
+    return category_mapping.matcher(user_id)
+
+
+def recategorize(transactions, old_matcher, new_matcher):
+    """Re-evaluate categories in place after the mapping changed.
+
+    Only rows whose matched keyword changed, or whose text contains a
+    keyword that was added or changed, are matched again. With
+    old_matcher=None (mapping the rows came from is unknown) every row is
+    matched again. Returns the number of rows whose category changed.
+    """
+    if old_matcher is new_matcher:
+        return 0
+    changed = None if old_matcher is None else new_matcher.changed_keywords(old_matcher)
+    if changed is not None and not changed:
+        return 0
+    probe = None if changed is None else _compile(sorted(k for k in changed if k in new_matcher.rank))
+
+    updated = 0
+    for transaction in transactions:
+        text = transaction.get("Match_Text")
+        if not isinstance(text, str) or transaction.get("Self_Transfer"):
+            continue
+        if changed is None or transaction.get("Matched_Keyword") in changed or (probe and probe.search(text)):
+            category, keyword = new_matcher.match(text)
+            if (category, keyword) != (transaction.get("Category"), transaction.get("Matched_Keyword")):
+                transaction["Category"], transaction["Matched_Keyword"] = category, keyword
+                updated += 1
+    return updated
@@ -0,0 +1,200 @@
+# Per-category spend forecasting and budget tracking
+#
+# Debits are aggregated into a category × month matrix once, and every model
+# below works on whole matrix columns: each smoothing step updates all
+# categories at the same time, so the cost grows with the number of months,
+# not with categories × months of Python loops.
+import calendar
+
+import numpy as np
+import pandas as pd
+
+from ledger_store import as_dataframe, without_self_transfers
+
+SEASON_LENGTH = 12  # months
+ALPHA_GRID = np.array([0.1, 0.2, 0.3, 0.5, 0.7, 0.9])  # level smoothing candidates, picked per category
+BETA = 0.1  # trend smoothing
+GAMMA = 0.3  # seasonal smoothing
+PHI = 0.9  # trend damping, so a short upswing is not extrapolated for ever
+AT_RISK_RATIO = 0.9  # projected spend above this share of the budget is flagged early
+
+FORECAST_COLUMNS = ["Category", "Last Month", "Month To Date", "Forecast", "Projected", "Budget", "Status"]
+
+
+def _dates(df):
+    if "Parsed_Date" in df.columns:
+        return pd.to_datetime(df["Parsed_Date"], errors="coerce")
+    if "Full_Date" in df.columns:
+        return pd.to_datetime(df["Full_Date"], errors="coerce", format="mixed")
+    return pd.Series(pd.NaT, index=df.index)
+
+
+def spending_matrix(transactions):
+    """Debit totals per category and calendar month.
+
+    Returns (categories, months, matrix) where `months` is a contiguous
+    PeriodIndex from the first to the last dated transaction (months without
+    spend are zero) and matrix[c, m] is the amount spent. Self-transfers
+    between the user's own accounts are left out.
+    """
+    df = as_dataframe(transactions, columns=["Parsed_Date", "Amount", "Category", "Self_Transfer"])
+    df = without_self_transfers(df)
+    if df.empty or "Amount" not in df.columns:
+        return [], pd.PeriodIndex([], freq="M"), np.zeros((0, 0))
+    dates = _dates(df)
+    amounts = pd.to_numeric(df["Amount"], errors="coerce").to_numpy()
+    debits = (amounts < 0) & dates.notna().to_numpy()
+    if not debits.any():
+        return [], pd.PeriodIndex([], freq="M"), np.zeros((0, 0))
+
+    periods = dates[debits].dt.to_period("M")
+    month_codes = (periods.dt.year * 12 + periods.dt.month - 1).to_numpy()
+    first = month_codes.min()
+    month_count = month_codes.max() - first + 1
+    category_codes, categories = pd.factorize(df["Category"].fillna("Other")[debits])
+
+    # One scatter-add builds the whole matrix
+    matrix = np.bincount(
+        category_codes * month_count + (month_codes - first),
+        weights=-amounts[debits],
+        minlength=len(categories) * month_count,
+    ).reshape(len(categories), month_count)
+    months = pd.period_range(pd.Period(year=first // 12, month=first % 12 + 1, freq="M"), periods=month_count, freq="M")
+    return list(categories), months, matrix
+
+
+def _holt(series, alpha, beta=BETA, phi=PHI):
+    """Damped-trend exponential smoothing over axis 0 (time).
+
+    `series` is (months, ...) and `alpha` broadcasts against the other axes.
+    Returns (one-month-ahead forecast, sum of squared one-step errors).
+    """
+    level = series[0] * np.ones_like(alpha)
+    trend = np.zeros_like(level)
+    sse = np.zeros_like(level)
+    for value in series[1:]:
+        predicted = level + phi * trend
+        sse += (value - predicted) ** 2
+        previous = level
+        level = alpha * value + (1 - alpha) * predicted
+        trend = beta * (level - previous) + (1 - beta) * phi * trend
+    return level + phi * trend, sse
+
+
+def _holt_winters(series, alpha, beta=BETA, gamma=GAMMA, phi=PHI, season=SEASON_LENGTH):
+    """Additive seasonal variant of _holt, initialized from the first two seasons."""
+    first, second = series[:season].mean(axis=0), series[season:2 * season].mean(axis=0)
+    level = second * np.ones_like(alpha)
+    trend = (second - first) / season * np.ones_like(alpha)
+    seasonal = list(series[:season] - first)  # one (…)-shaped array per month of the year
+    sse = np.zeros_like(level)
+    for t in range(season, len(series)):
+        value = series[t]
+        index = t % season
+        predicted = level + phi * trend + seasonal[index]
+        sse += (value - predicted) ** 2
+        previous = level
+        level = alpha * (value - seasonal[index]) + (1 - alpha) * (previous + phi * trend)
+        trend = beta * (level - previous) + (1 - beta) * phi * trend
+        seasonal[index] = gamma * (value - level) + (1 - gamma) * seasonal[index]
+    return level + phi * trend + seasonal[len(series) % season], sse
+
+
+def forecast_matrix(matrix, season=SEASON_LENGTH):
+    """Next-month forecast for every row (category) of a category × month matrix.
+
+    Uses additive Holt-Winters once two full seasons of history exist and
+    damped Holt smoothing otherwise. The level smoothing factor is chosen
+    per category from ALPHA_GRID by one-step-ahead error; the grid is an
+    extra array axis, so all candidates are fitted in the same pass.
+    """
+    categories, months = matrix.shape
+    if categories == 0 or months == 0:
+        return np.zeros(categories)
+    if months == 1:
+        return matrix[:, 0].astype(float)
+
+    series = matrix.T.astype(float)[:, None, :]  # (months, 1, categories)
+    alpha = ALPHA_GRID[:, None]  # (grid, 1)
+    if months >= 2 * season:
+        forecasts, sse = _holt_winters(series, alpha, season=season)
+    else:
+        forecasts, sse = _holt(series, alpha)
+    best = np.argmin(sse, axis=0)
+    return np.maximum(forecasts[best, np.arange(categories)], 0.0)
+
+
+def _month_progress(as_of):
+    """Fraction of the month elapsed at the end of `as_of`'s day."""
+    days = calendar.monthrange(as_of.year, as_of.month)[1]
+    return as_of.day / days
+
+
+def forecast_spending(transactions, as_of=None):
+    """Forecast spend per category for the month being tracked.
+
+    The month containing `as_of` (default: the latest transaction date) is
+    the month being tracked. If that month is still in progress the model
+    is fitted on the months before it, and the projection is the spend so
+    far plus the forecast for the part of the month still to come. Once the
+    month is over the forecast is for the following month.
+    """
+    df = as_dataframe(transactions, columns=["Parsed_Date", "Amount", "Category", "Self_Transfer"])
+    categories, months, matrix = spending_matrix(df)
+    if not categories:
+        return pd.DataFrame(columns=FORECAST_COLUMNS[:-2])
+
+    as_of = pd.Timestamp(as_of) if as_of is not None else _dates(df).max()
+    last_month = months[-1]
+    progress = _month_progress(as_of) if as_of.to_period("M") == last_month else 1.0
+
+    if progress < 1.0:
+        # Fit on the finished months; the current one is what we are tracking
+        history, month_to_date = matrix[:, :-1], matrix[:, -1]
+        if history.shape[1]:
+            previous, forecast = history[:, -1], forecast_matrix(history)
+        else:
+            previous, forecast = np.zeros(len(categories)), month_to_date / progress
+        projected = month_to_date + forecast * (1.0 - progress)
+        tracked = last_month
+    else:
+        month_to_date = np.zeros(len(categories))
+        previous, forecast = matrix[:, -1], forecast_matrix(matrix)
+        projected = forecast
+        tracked = last_month + 1
+
+    result = pd.DataFrame({
+        "Category": categories,
+        "Last Month": previous,
+        "Month To Date": month_to_date,
+        "Forecast": forecast,
+        "Projected": projected,
+    })
+    result.attrs["month"] = tracked.strftime("%b %Y")
+    result.attrs["progress"] = progress
+    return result.sort_values("Projected", ascending=False, ignore_index=True)
+
+
+def check_budgets(forecast, budgets=None):
+    """Add Budget and Status columns to a forecast_spending() frame.
+
+    `budgets` maps category to a monthly amount; categories without a
+    positive budget are reported as "No budget" and never flagged.
+    """
+    budgets = budgets or {}
+    result = forecast.copy()
+    budget = result["Category"].map(lambda category: float(budgets.get(category) or 0.0)).to_numpy(dtype=float)
+    month_to_date = result["Month To Date"].to_numpy(dtype=float)
+    projected = result["Projected"].to_numpy(dtype=float)
+    result["Budget"] = np.where(budget > 0, budget, np.nan)
+    result["Status"] = np.select(
+        [budget <= 0, month_to_date > budget, projected > budget, projected > AT_RISK_RATIO * budget],
+        ["No budget", "Over budget", "On track to overspend", "Close to budget"],
+        default="Within budget",
+    )
+    return result
+
+
+def forecast_budgets(transactions, budgets=None, as_of=None):
+    """forecast_spending() followed by check_budgets()."""
+    return check_budgets(forecast_spending(transactions, as_of), budgets)
@@ -0,0 +1,139 @@
+# Lazy, chunked export of parsed transactions to CSV, Parquet and Excel
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+EXPORT_COLUMNS = [
+    "Date", "Full_Date", "Description", "Amount", "Type",
+    "Category", "Month_Year", "Transaction_ID", "UTR",
+]
+
+# Format name -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+    "Excel": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+CHUNK_SIZE = 10_000
+EXCEL_MAX_ROWS = 1_000_000  # Excel caps a sheet at 1,048,576 rows
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "upi_analyzer_exports")
+# Exports hold full transaction histories: keep them only briefly and only a few at a time
+EXPORT_MAX_AGE = 60 * 60  # seconds
+MAX_CACHED_EXPORTS = 50
+
+
+def _chunks(transactions, chunk_size=CHUNK_SIZE):
+    """Yield the ledger as DataFrames of at most chunk_size rows."""
+    if isinstance(transactions, pd.DataFrame):
+        for start in range(0, len(transactions), chunk_size):
+            yield transactions.iloc[start:start + chunk_size].reindex(columns=EXPORT_COLUMNS)
+        return
+    for start in range(0, len(transactions), chunk_size):
+        yield pd.DataFrame(transactions[start:start + chunk_size], columns=EXPORT_COLUMNS)
+
+
+def _write_csv(transactions, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for i, chunk in enumerate(_chunks(transactions)):
+            chunk.to_csv(f, header=(i == 0), index=False)
+
+
+def _write_parquet(transactions, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [(c, pa.float64() if c == "Amount" else pa.string()) for c in EXPORT_COLUMNS]
+    )
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in _chunks(transactions):
+            chunk["Amount"] = pd.to_numeric(chunk["Amount"], errors="coerce")
+            for column in EXPORT_COLUMNS:
+                if column != "Amount":
+                    chunk[column] = chunk[column].astype(object).where(chunk[column].notna(), None)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def _write_excel(transactions, path):
+    from openpyxl import Workbook
+
+    # Write-only mode streams rows to disk instead of keeping cells in memory
+    workbook = Workbook(write_only=True)
+    sheet, sheet_rows = None, EXCEL_MAX_ROWS
+    for chunk in _chunks(transactions):
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            if sheet_rows >= EXCEL_MAX_ROWS:
+                sheet = workbook.create_sheet(f"Transactions {len(workbook.worksheets) + 1}")
+                sheet.append(EXPORT_COLUMNS)
+                sheet_rows = 0
+            sheet.append(row)
+            sheet_rows += 1
+    if sheet is None:
+        workbook.create_sheet("Transactions 1").append(EXPORT_COLUMNS)
+    workbook.save(path)
+
+
+_WRITERS = {
+    "CSV": _write_csv,
+    "Parquet": _write_parquet,
+    "Excel": _write_excel,
+}
+
+
+def export_path(ledger_version, fmt, export_dir=EXPORT_DIR):
+    extension, _ = EXPORT_FORMATS[fmt]
+    return os.path.join(export_dir, f"transactions_{ledger_version}{extension}")
+
+
+def prune_exports(export_dir=EXPORT_DIR, max_age=EXPORT_MAX_AGE, max_files=MAX_CACHED_EXPORTS):
+    """Delete exports older than `max_age` seconds, then the oldest beyond `max_files`."""
+    try:
+        entries = [entry for entry in os.scandir(export_dir) if entry.is_file()]
+    except FileNotFoundError:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    cutoff = time.time() - max_age
+    for position, entry in enumerate(entries):
+        if position >= max_files or entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass  # removed by another session at the same time
+
+
+def cached_export(ledger_version, fmt, export_dir=EXPORT_DIR):
+    """Return the path of an already generated export, or None."""
+    if not ledger_version:
+        return None
+    prune_exports(export_dir)
+    path = export_path(ledger_version, fmt, export_dir)
+    return path if os.path.exists(path) else None
+
+
+def export_transactions(transactions, fmt, ledger_version, export_dir=EXPORT_DIR):
+    """Write the ledger in the requested format, reusing a cached artifact.
+
+    Rows are streamed to a temporary file in chunks and renamed into place
+    once complete, so a cached path always points at a finished file.
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    path = cached_export(ledger_version, fmt, export_dir)
+    if path:
+        return path
+
+    os.makedirs(export_dir, exist_ok=True)
+    path = export_path(ledger_version, fmt, export_dir)
+    fd, tmp_path = tempfile.mkstemp(dir=export_dir, suffix=EXPORT_FORMATS[fmt][0])
+    os.close(fd)
+    try:
+        _WRITERS[fmt](transactions, tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return path
@@ -0,0 +1,254 @@
+# Time-partitioned, memory-mapped on-disk ledger
+#
+# Layout: <root>/<user_id>/<YYYY-MM>.arrow, one uncompressed Arrow IPC file per
+# user and month (undated rows go to "undated.arrow"). Uncompressed IPC files
+# can be memory-mapped and read without copying, so a query only pages in the
+# partitions and columns it actually touches.
+import os
+import re
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+LEDGER_SCHEMA = pa.schema([
+    ("Parsed_Date", pa.timestamp("us")),
+    ("Date", pa.string()),
+    ("Full_Date", pa.string()),
+    ("Description", pa.string()),
+    ("Amount", pa.float64()),
+    ("Type", pa.string()),
+    ("Category", pa.string()),
+    ("Month_Year", pa.string()),
+    ("Transaction_ID", pa.string()),
+    ("UTR", pa.string()),
+    # Kept so stored rows can be recategorized when the category mapping changes
+    ("Matched_Keyword", pa.string()),
+    ("Match_Text", pa.string()),
+    ("Self_Transfer", pa.bool_()),
+])
+LEDGER_COLUMNS = LEDGER_SCHEMA.names
+UNDATED = "undated"
+CATEGORY_VERSION_FILE = "category_version"
+ROW_KEY = ["Parsed_Date", "Description", "Amount", "Type", "Transaction_ID", "UTR"]
+
+_USER_ID_PATTERN = re.compile(r"[A-Za-z0-9_\-][A-Za-z0-9_.\-]*")
+_MONTH_PATTERN = re.compile(r"\d{4}-\d{2}")
+
+
+def is_valid_user_id(user_id):
+    """User ids name a partition directory: letters, digits, '_', '-' and '.' (not leading)."""
+    return bool(_USER_ID_PATTERN.fullmatch(str(user_id)))
+
+
+def _to_frame(transactions):
+    """Coerce parsed transactions to the ledger schema."""
+    df = transactions if isinstance(transactions, pd.DataFrame) else pd.DataFrame(transactions)
+    df = df.reindex(columns=LEDGER_COLUMNS)
+    df["Parsed_Date"] = pd.to_datetime(df["Parsed_Date"], errors="coerce").fillna(
+        pd.to_datetime(df["Full_Date"], errors="coerce", format="mixed")
+    )
+    df["Amount"] = pd.to_numeric(df["Amount"], errors="coerce")
+    df["Self_Transfer"] = df["Self_Transfer"].astype(object).where(df["Self_Transfer"].notna(), False).astype(bool)
+    for column in LEDGER_COLUMNS:
+        if column not in ("Parsed_Date", "Amount", "Self_Transfer"):
+            df[column] = df[column].astype(object).where(df[column].notna(), None)
+    return df
+
+
+def _row_hashes(frame):
+    return pd.util.hash_pandas_object(frame[ROW_KEY].astype(str), index=False).to_numpy()
+
+
+def _shift_month(month, offset):
+    year, mon = map(int, month.split("-"))
+    index = year * 12 + (mon - 1) + offset
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+class PartitionedLedger:
+    """Multi-user transaction history partitioned by user and month."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _user_dir(self, user_id):
+        if not is_valid_user_id(user_id):
+            raise ValueError(f"Invalid user id: {user_id!r}")
+        return os.path.join(self.root, str(user_id))
+
+    def _path(self, user_id, month):
+        return os.path.join(self._user_dir(user_id), f"{month}.arrow")
+
+    def users(self):
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def months(self, user_id):
+        """Sorted YYYY-MM partition keys for a user (undated rows excluded)."""
+        user_dir = self._user_dir(user_id)
+        if not os.path.isdir(user_dir):
+            return []
+        names = (os.path.splitext(f)[0] for f in os.listdir(user_dir) if f.endswith(".arrow"))
+        return sorted(n for n in names if _MONTH_PATTERN.fullmatch(n))
+
+    def _read_partition(self, path, columns=None):
+        # Buffers returned here point straight into the memory map
+        source = pa.memory_map(path, "r")
+        table = pa.ipc.open_file(source).read_all()
+        columns = columns or LEDGER_COLUMNS
+        # Partitions written before a column was added to the schema read it as nulls
+        for name in columns:
+            if name not in table.schema.names:
+                field = LEDGER_SCHEMA.field(name)
+                table = table.append_column(field, pa.nulls(len(table), field.type))
+        return table.select(columns)
+
+    def _write_partition(self, path, table):
+        tmp_path = f"{path}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, LEDGER_SCHEMA) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+    def append(self, user_id, transactions):
+        """Merge parsed transactions into the user's monthly partitions.
+
+        Only the partitions for months present in `transactions` are
+        rewritten. Rows already stored are not duplicated, so ingesting the
+        same statement twice is harmless.
+        """
+        frame = _to_frame(transactions)
+        if frame.empty:
+            return []
+        os.makedirs(self._user_dir(user_id), exist_ok=True)
+        keys = frame["Parsed_Date"].dt.strftime("%Y-%m").fillna(UNDATED)
+
+        written = []
+        for month, part in frame.groupby(keys, sort=True):
+            path = self._path(user_id, month)
+            if os.path.exists(path):
+                existing = self._read_partition(path).to_pandas()
+                part = part[~pd.Series(_row_hashes(part)).isin(_row_hashes(existing)).to_numpy()]
+                if part.empty:
+                    continue
+                part = pd.concat([existing, part], ignore_index=True)
+            part = part.sort_values("Parsed_Date", kind="stable")
+            self._write_partition(path, pa.Table.from_pandas(part, schema=LEDGER_SCHEMA, preserve_index=False))
+            written.append(month)
+        return written
+
+    def update_rows(self, user_id, update):
+        """Rewrite stored rows in place, one partition at a time.
+
+        `update(rows)` receives a partition as a list of dicts, edits them in
+        place and returns how many it changed; only partitions with changes
+        are written back. Returns the total number of changed rows.
+        """
+        paths = [self._path(user_id, m) for m in self.months(user_id)]
+        undated = self._path(user_id, UNDATED)
+        if os.path.exists(undated):
+            paths.append(undated)
+
+        changed = 0
+        for path in paths:
+            rows = self._read_partition(path).to_pandas().to_dict("records")
+            count = update(rows)
+            if count:
+                self._write_partition(path, pa.Table.from_pandas(_to_frame(rows), schema=LEDGER_SCHEMA,
+                                                                 preserve_index=False))
+                changed += count
+        return changed
+
+    def category_version(self, user_id):
+        """Category mapping version the user's stored categories were computed with, if recorded."""
+        try:
+            with open(os.path.join(self._user_dir(user_id), CATEGORY_VERSION_FILE), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def set_category_version(self, user_id, version):
+        os.makedirs(self._user_dir(user_id), exist_ok=True)
+        path = os.path.join(self._user_dir(user_id), CATEGORY_VERSION_FILE)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(f"{path}.tmp", path)
+
+    def scan(self, user_id, start_month=None, end_month=None, columns=None, include_undated=False):
+        """Read only the partitions in [start_month, end_month] and the requested columns."""
+        months = [m for m in self.months(user_id)
+                  if (start_month is None or m >= start_month) and (end_month is None or m <= end_month)]
+        paths = [self._path(user_id, m) for m in months]
+        undated = self._path(user_id, UNDATED)
+        if include_undated and os.path.exists(undated):
+            paths.append(undated)
+
+        schema = pa.schema([LEDGER_SCHEMA.field(c) for c in columns]) if columns else LEDGER_SCHEMA
+        tables = [self._read_partition(p, columns) for p in paths]
+        if not tables:
+            return schema.empty_table()
+        return pa.concat_tables(tables)
+
+    def view(self, user_id, start_month=None, end_month=None, last_n_months=None):
+        """A lazy slice of a user's history that analysis functions can consume.
+
+        `last_n_months` counts back from the latest stored month rather than
+        from today, so older statements still produce a full window.
+        """
+        if last_n_months is not None:
+            months = self.months(user_id)
+            if months:
+                end_month = end_month or months[-1]
+                start_month = _shift_month(end_month, -(last_n_months - 1))
+        return LedgerView(self, user_id, start_month, end_month)
+
+    def monthly_spending(self, user_id, last_n_months=12):
+        """Total debit amount per month, touching only the Amount column of each partition."""
+        view = self.view(user_id, last_n_months=last_n_months)
+        rows = []
+        for month in view.months():
+            table = self._read_partition(self._path(user_id, month), ["Amount", "Self_Transfer"])
+            amounts = table.column("Amount")
+            # Transfers between the user's own accounts are not spending
+            debits = pc.and_(pc.less(amounts, 0), pc.invert(pc.fill_null(table.column("Self_Transfer"), False)))
+            spent = pc.sum(pc.filter(amounts, debits)).as_py() or 0.0
+            rows.append({"Month": month, "Amount": abs(spent)})
+        return pd.DataFrame(rows, columns=["Month", "Amount"])
+
+
+class LedgerView:
+    """A user and month range over a PartitionedLedger, materialized on demand."""
+
+    def __init__(self, ledger, user_id, start_month=None, end_month=None):
+        self.ledger = ledger
+        self.user_id = user_id
+        self.start_month = start_month
+        self.end_month = end_month
+
+    def months(self):
+        return [m for m in self.ledger.months(self.user_id)
+                if (self.start_month is None or m >= self.start_month)
+                and (self.end_month is None or m <= self.end_month)]
+
+    def to_arrow(self, columns=None):
+        return self.ledger.scan(self.user_id, self.start_month, self.end_month, columns)
+
+    def to_pandas(self, columns=None):
+        return self.to_arrow(columns).to_pandas()
+
+
+def as_dataframe(source, columns=None):
+    """Materialize a LedgerView (only `columns`), or pass other inputs through as a DataFrame."""
+    if isinstance(source, LedgerView):
+        return source.to_pandas(columns)
+    if isinstance(source, pd.DataFrame):
+        return source
+    return pd.DataFrame(source)
+
+
+def without_self_transfers(df):
+    """Drop rows flagged Self_Transfer: money moved between the user's own accounts is neither income nor spending."""
+    if "Self_Transfer" not in df.columns:
+        return df
+    return df[~df["Self_Transfer"].eq(True).to_numpy(dtype=bool, na_value=False)]
@@ -1,342 +1,29 @@
 import streamlit as st
-import PyPDF2
-import google.generativeai as genai
-import re
 import pandas as pd
 import plotly.express as px
-from datetime import datetime
+import hashlib
+import math
+import os
 
-# Category mapping for categorization of transactions
-from Category import category_keywords  # Assuming Category.py is in the same directory
-
-# 📄 Extract text from PDF
-def extract_text_from_pdf(file):
-    try:
-        reader = PyPDF2.PdfReader(file)
-        text = ""
-        for page in reader.pages:
-            content = page.extract_text()
-            if content:
-                text += content + "\n"
-        return text.strip()
-    except Exception as e:
-        st.error(f"PDF Extraction Error: {e}")
-        return ""
-
-# �🧑‍💼 Analyze financial data using Gemini
-def analyze_financial_data(text, api_key):
-    try:
-        genai.configure(api_key=api_key)
-        prompt = f"""
-You are a certified financial advisor. Review the following UPI transaction data and create a detailed, professional financial analysis report.
-**Guidelines:**
-- Base your analysis only on the provided UPI transaction data.
-- Use clear structure (headings, bullet points) and a professional tone.
-- Include specific amounts from transactions in your analysis.
-- Highlight key spending categories and patterns.
-- Provide concrete recommendations with actionable steps.
-- Avoid Disclaimers and Data Insuffcient
-
-**Report Sections to Include**:
-1. **Executive Summary**
-   - Overview of financial activity.
-   - Key highlights.
-2. **Income vs. Expenses**
-   - Total credit vs. debit amounts.
-   - Net cash flow (savings or overspending).
-3. **Transaction Summary**
-   - Count of credit/debit transactions.
-   - Notable inflows/outflows.
-4. **Spending Pattern Analysis**
-   - Top categories and merchants.
-   - Recurring patterns (e.g., OTT, food delivery).
-5. **Spending Efficiency & Potential Wastage**
-   - Any inefficient or avoidable expense trends.
-6. **Savings & Budget Recommendations**
-   - Practical advice to reduce spending and improve financial health.
-7. **Conclusion & Strategy**
-   - Final insights with actionable tips.
-Transaction History:
-{text}
-        """
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        st.error(f"Gemini Error: {e}")
-        return ""
-
-def extract_statement_period(text):
-    # Try Paytm format first
-    match = re.search(r"UPI Statement for\s+(\d{1,2} [A-Z]{3})'(\d{2})\s*-\s*(\d{1,2} [A-Z]{3})'(\d{2})", text)
-    if match:
-        start_day_month, start_year = match.group(1), match.group(2)
-        end_day_month, end_year = match.group(3), match.group(4)
-        try:
-            start_date = datetime.strptime(f"{start_day_month} 20{start_year}", "%d %b %Y")
-            end_date = datetime.strptime(f"{end_day_month} 20{end_year}", "%d %b %Y")
-            return start_date, end_date
-        except ValueError:
-            pass
-    
-    # Try PhonePe format if Paytm format not found
-    match = re.search(r"(\w{3} \d{2}, \d{4}) - (\w{3} \d{2}, \d{4})", text)
-    if match:
-        try:
-            start_date = datetime.strptime(match.group(1), "%b %d, %Y")
-            end_date = datetime.strptime(match.group(2), "%b %d, %Y")
-            return start_date, end_date
-        except ValueError:
-            pass
-    
-    return None, None
-
-def detect_statement_source(text):
-    """Detect whether the statement is from Paytm or PhonePe"""
-    if "UPI Ref No" in text and "Total Money Paid" in text:
-        return "Paytm"
-    elif "Transaction ID" in text and "UTR No" in text and "Transaction Statement for" in text:
-        return "PhonePe"
-    return "Unknown"
-
-def parse_phonepe_data(text):
-    """Parse PhonePe transaction data using line-by-line analysis"""
-    transactions = []
-    current_year = datetime.now().year
-    
-    # Clean and prepare lines
-    lines = [line.strip() for line in text.splitlines() if line.strip()]
-    lines = [l for l in lines if not l.startswith("Page") and "system generated" not in l.lower()]
-    
-    # Enhanced patterns for matching
-    date_pattern = re.compile(r"^[A-Za-z]{3} \d{1,2}, \d{4}$")  # "Mar 15, 2024"
-    time_pattern = re.compile(r"\d{1,2}:\d{2} [AP]M")  # "2:30 PM"
-    amount_pattern = re.compile(r"(?:INR|Rs\.?)\s*([\d,]+\.\d{2})")  # Matches both "INR 1,234.56" and "Rs. 1234.56"
-    txn_id_pattern = re.compile(r"Transaction ID\s*:\s*(\w+)")
-    utr_pattern = re.compile(r"UTR No\s*:\s*(\w+)")
-    account_pattern = re.compile(r"(Debited from|Credited to)\s+(XX\d+|Bank Account)")
-    
-    i = 0
-    while i < len(lines):
-        if date_pattern.match(lines[i]):
-            # Start of a new transaction block
-            date_str = lines[i]
-            i += 1
-            
-            # Collect all lines until next date or end
-            block = []
-            while i < len(lines) and not date_pattern.match(lines[i]):
-                block.append(lines[i])
-                i += 1
-                
-            try:
-                # Initialize transaction fields
-                time_str = ""
-                description = ""
-                txn_id = ""
-                utr = ""
-                account = ""
-                txn_type = ""
-                amount = 0.0
-                
-                # Process block lines
-                for line in block:
-                    # Extract time if not found yet
-                    if not time_str:
-                        time_match = time_pattern.search(line)
-                        if time_match:
-                            time_str = time_match.group()
-                            
-                    # Extract transaction ID
-                    txn_id_match = txn_id_pattern.search(line)
-                    if txn_id_match and not txn_id:
-                        txn_id = txn_id_match.group(1)
-                        
-                    # Extract UTR
-                    utr_match = utr_pattern.search(line)
-                    if utr_match and not utr:
-                        utr = utr_match.group(1)
-                        
-                    # Extract account and transaction type
-                    account_match = account_pattern.search(line)
-                    if account_match and not account:
-                        txn_type = "Debit" if "Debited" in account_match.group(1) else "Credit"
-                        account = account_match.group(2)
-                        
-                    # Extract amount - enhanced to handle different formats
-                    amount_match = amount_pattern.search(line)
-                    if amount_match:
-                        amount = float(amount_match.group(1).replace(",", ""))
-                        # Force negative for debits
-                        if txn_type == "Debit":
-                            amount = -abs(amount)
-                            
-                    # Extract description (first non-metadata line)
-                    if (not description and not any(x in line for x in ["Transaction ID", "UTR No", "Debited from", "Credited to", "INR", "Rs."]) and 
-                        not time_pattern.search(line)):
-                        description = line.strip()
-                
-                # Enhanced datetime parsing with fallbacks
-                full_datetime = None
-                display_date = f"{date_str} {time_str}" if time_str else date_str
-                month_year = "Unknown"
-                
-                try:
-                    # Try parsing with current year first
-                    date_obj = datetime.strptime(f"{date_str}", "%b %d, %Y")
-                    if time_str:
-                        try:
-                            time_obj = datetime.strptime(time_str, "%I:%M %p").time()
-                        except:
-                            time_obj = datetime.strptime(time_str, "%H:%M").time()
-                        full_datetime = datetime.combine(date_obj.date(), time_obj)
-                    else:
-                        full_datetime = date_obj
-                    
-                    display_date = full_datetime.strftime("%b %d %H:%M") if time_str else full_datetime.strftime("%b %d")
-                    month_year = full_datetime.strftime("%b %Y")
-                except ValueError:
-                    try:
-                        # Fallback to current year if year is missing
-                        date_obj = datetime.strptime(f"{date_str.split(',')[0].strip()} {current_year}", "%b %d %Y")
-                        if time_str:
-                            time_obj = datetime.strptime(time_str, "%I:%M %p").time()
-                            full_datetime = datetime.combine(date_obj.date(), time_obj)
-                        else:
-                            full_datetime = date_obj
-                        display_date = full_datetime.strftime("%b %d %H:%M") if time_str else full_datetime.strftime("%b %d")
-                        month_year = full_datetime.strftime("%b %Y")
-                    except:
-                        pass
-                
-                # Categorize transaction
-                category = "Other"
-                full_text = f"{description} {txn_type}".lower()
-                for keyword, mapped_category in category_keywords.items():
-                    if keyword in full_text:
-                        category = mapped_category
-                        break
-                
-                # Add transaction with consistent fields
-                transaction = {
-                    "Date": display_date,
-                    "Description": description,
-                    "Amount": amount,
-                    "Category": category,
-                    "Type": txn_type,
-                    "Month_Year": month_year
-                }
-                
-                # Add datetime fields only if we have valid dates
-                if full_datetime:
-                    transaction["Full_Date"] = full_datetime.strftime("%Y-%m-%d %H:%M:%S") if time_str else full_datetime.strftime("%Y-%m-%d")
-                    transaction["Parsed_Date"] = full_datetime
-                else:
-                    transaction["Full_Date"] = None
-                    transaction["Parsed_Date"] = None
-                
-                transactions.append(transaction)
-                
-            except Exception as e:
-                st.warning(f"Skipping malformed transaction block: {str(e)}", icon="⚠️")
-                continue
-        else:
-            i += 1
-    
-    if not transactions:
-        st.error("""
-        No transactions found. Possible reasons:
-        1. The statement format doesn't match expected PhonePe format
-        2. The PDF text extraction failed
-        3. The statement is empty
-        """)
-    
-    return transactions
-
-def parse_paytm_data(text):
-    transactions = []
-    start_date, end_date = extract_statement_period(text)
-    if not start_date or not end_date:
-        start_date = datetime.now().replace(month=1, day=1)
-        end_date = datetime.now()
-
-    current_year = start_date.year
-    previous_month = None
-
-    # Improved pattern to capture amounts
-    pattern = r"(\d{1,2} [A-Za-z]{3})\n(\d{1,2}:\d{2} [AP]M)(.*?)(?=\d{1,2} [A-Za-z]{3}\n\d{1,2}:\d{2} [AP]M|\Z)"
-    matches = re.finditer(pattern, text, re.DOTALL)
-
-    for match in matches:
-        date_str = match.group(1).strip()
-        time_str = match.group(2).strip()
-        details = match.group(3).strip()
-
-        try:
-            day, month_abbr = date_str.split()
-            month_abbr = month_abbr.upper()
-            current_month = {
-                'JAN': 1, 'FEB': 2, 'MAR': 3, 'APR': 4, 'MAY': 5, 'JUN': 6,
-                'JUL': 7, 'AUG': 8, 'SEP': 9, 'OCT': 10, 'NOV': 11, 'DEC': 12
-            }[month_abbr]
-
-            if previous_month is not None and current_month < previous_month and previous_month == 12:
-                current_year += 1
-            previous_month = current_month
-
-            try:
-                time_obj = datetime.strptime(time_str, "%I:%M %p").time()
-            except:
-                time_obj = datetime.strptime(time_str, "%H:%M").time()
-
-            full_datetime = datetime.combine(
-                datetime(current_year, current_month, int(day)).date(),
-                time_obj
-            )
-            display_date = full_datetime.strftime("%b %d %H:%M")
-            month_year = full_datetime.strftime("%b %Y")
-        except Exception as e:
-            full_datetime = None
-            display_date = f"{date_str} {time_str}"
-            month_year = "Unknown"
-
-        # Improved amount extraction for Paytm
-        amount_match = re.search(r"([+-])\s?Rs\.?\s?(\d+(?:,\d{3})*(?:\.\d{2})?)", details)
-        if amount_match:
-            sign = amount_match.group(1)
-            amount = float(amount_match.group(2).replace(",", ""))
-            amount = -amount if sign == "-" else amount
-        else:
-            amount = 0.0
-            
-        merchant_line = details.split("\n")[0]
-        merchant = re.sub(r"UPI Ref No:.*", "", merchant_line).strip()
-
-        category = "Other"
-        full_text = f"{merchant} {details}".lower()
-        for keyword, mapped_category in category_keywords.items():
-            if keyword in full_text:
-                category = mapped_category
-                break
-
-        transactions.append({
-            "Date": display_date,
-            "Description": merchant,
-            "Amount": amount,
-            "Category": category,
-            "Full_Date": full_datetime.strftime("%Y-%m-%d %H:%M:%S") if full_datetime else None,
-            "Month_Year": month_year,
-            "Type": "Debit" if amount < 0 else "Credit",
-            "Parsed_Date": full_datetime if full_datetime else None
-        })
-    
-    return transactions
+from statement_parser import extract_text_from_pdf, detect_statement_source, parse_statement
+from category_matching import get_matcher, recategorize
+from report_generator import build_offline_report, stream_financial_analysis, transactions_to_text
+from analyzer_client import (AnalysisServiceError, analyze_statement_remote, analyze_text_remote,
+                             get_benchmarks, submit_benchmark_upload)
+from reconcile import reconcile_statements
+from transaction_explorer import TransactionIndex, DISPLAY_COLUMNS, SORTABLE_COLUMNS
+from ledger_export import EXPORT_FORMATS, cached_export, export_transactions
+from ledger_store import PartitionedLedger, as_dataframe, is_valid_user_id, without_self_transfers
+from forecasting import check_budgets, forecast_spending
+from benchmarks import compare_to_peers, population, statement_sketches
 
 def generate_visualizations(transactions_df):
     charts = {}
     
-    if not isinstance(transactions_df, pd.DataFrame):
-        transactions_df = pd.DataFrame(transactions_df)
+    # Accepts a DataFrame, a list of transactions or a LedgerView over the on-disk ledger
+    transactions_df = as_dataframe(transactions_df, columns=["Parsed_Date", "Description", "Amount", "Category", "Self_Transfer"])
+    # Transfers between the user's own accounts are not spending
+    transactions_df = without_self_transfers(transactions_df).copy()
     
     # Debug: Show raw data
     #st.write("Raw transaction data sample:", transactions_df.head(3))
@@ -464,6 +151,7 @@ def get_cost_control_suggestions(transactions_df):
     }
     
     # Generate category-specific suggestions based on actual spending
+    transactions_df = without_self_transfers(as_dataframe(transactions_df, columns=["Amount", "Category", "Self_Transfer"]))
     debit_transactions = transactions_df[transactions_df['Amount'] < 0].copy()
     debit_transactions['Amount'] = debit_transactions['Amount'].abs()
     category_spending = debit_transactions.groupby('Category')['Amount'].sum()
@@ -481,6 +169,16 @@ def get_cost_control_suggestions(transactions_df):
     
     return pd.DataFrame(detailed_suggestions)
 
+def _ordinal(n):
+    suffix = "th" if 10 <= n % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+def _login_configured():
+    try:
+        return "auth" in st.secrets
+    except FileNotFoundError:  # no secrets.toml at all
+        return False
+
 # 🌐 Streamlit Page Config
 st.set_page_config(page_title="💸 AI Financial Analyzer", layout="wide")
 
@@ -540,10 +238,33 @@ st.markdown("""
 
 # Sidebar Configuration
 st.sidebar.markdown("### 🚀 Navigation")
-page = st.sidebar.radio("Select Page", ["Main Analysis", "Visualizations", "Cost Control Suggestions"])
+page = st.sidebar.radio("Select Page", ["Main Analysis", "Transactions", "Visualizations", "Budget & Forecast", "Cost Control Suggestions"])
+
+gemini_api_key = st.sidebar.text_input("Enter your Gemini API key (optional):", type="password")
+uploaded_files = st.sidebar.file_uploader(
+    "📁 Upload your UPI Transaction PDFs (Paytm and/or PhonePe)", type=["pdf"], accept_multiple_files=True
+)
+
+# Optional persistent history: set UPI_LEDGER_DIR to keep every statement in the on-disk ledger.
+# A partition belongs to the signed-in account (st.login), never to anything typed into the page,
+# so without a login nothing is kept and no visitor can read or add to another one's history.
+ledger_dir = os.environ.get("UPI_LEDGER_DIR")
+account = (st.user.get("sub") or st.user.get("email")) if st.user.get("is_logged_in") else None
+ledger_user = f"user-{hashlib.sha1(str(account).encode('utf-8')).hexdigest()}" if account else None
+ledger = PartitionedLedger(ledger_dir) if ledger_dir and ledger_user else None
+if ledger_dir and not ledger_user:
+    st.sidebar.caption("🔒 Sign in to keep your statement history. This session is not saved.")
+    if _login_configured():
+        st.sidebar.button("Log in", on_click=st.login)
+
+# The category profile only selects per-user overrides from the category mapping file
+category_profile = st.sidebar.text_input("Category profile", value="default").strip() or "default"
+if not is_valid_user_id(category_profile):
+    st.sidebar.error("❌ Category profile may only contain letters, digits, '_', '-' and '.'")
+    st.stop()
 
-gemini_api_key = st.sidebar.text_input("Enter your Gemini API key:", type="password")
-uploaded_file = st.sidebar.file_uploader("📁 Upload your UPI Transaction PDF", type=["pdf"])
+# Optional analysis service: set UPI_ANALYZER_SERVICE_URL to parse and analyze via service.py
+service_url = os.environ.get("UPI_ANALYZER_SERVICE_URL")
 
 # Initialize session state
 if 'transactions' not in st.session_state:
@@ -554,6 +275,18 @@ if 'visualizations' not in st.session_state:
     st.session_state.visualizations = None
 if 'statement_source' not in st.session_state:
     st.session_state.statement_source = None
+if 'ledger_version' not in st.session_state:
+    st.session_state.ledger_version = None
+if 'transaction_index' not in st.session_state:
+    st.session_state.transaction_index = None
+if 'extracted_text' not in st.session_state:
+    st.session_state.extracted_text = None
+if 'category_matcher' not in st.session_state:
+    st.session_state.category_matcher = None
+if 'reconcile_stats' not in st.session_state:
+    st.session_state.reconcile_stats = None
+if 'budgets' not in st.session_state:
+    st.session_state.budgets = {}
 
 # Main Page Header
 st.markdown('<div class="main-title">💸 Personal UPI Usage and Financial Analyzer</div>', unsafe_allow_html=True)
@@ -563,160 +296,427 @@ if st.session_state.transactions and st.session_state.ai_response:
     st.write("Data loaded successfully!")
 #else:
     #st.warning("No data loaded yet.")
-# Process uploaded file
-if uploaded_file and gemini_api_key:
-    with st.spinner("📄 Extracting text from PDF..."):
-        extracted_text = extract_text_from_pdf(uploaded_file)
-    
-    if extracted_text:
-        with st.spinner("🔍 Detecting statement source..."):
-            source = detect_statement_source(extracted_text)
-            st.session_state.statement_source = source
-            st.sidebar.markdown(f"**Detected Source:** <span class='detected-source'>{source}</span>", unsafe_allow_html=True)
-            
+# Process uploaded files
+if uploaded_files:
+    file_bytes = [uploaded_file.getvalue() for uploaded_file in uploaded_files]
+    ledger_version = hashlib.sha1(b"".join(hashlib.sha1(data).digest() for data in file_bytes)).hexdigest()
+    multiple_statements = len(file_bytes) > 1
+
+    # Statements are parsed once, here or on the analysis service, and cached for later reruns
+    if st.session_state.ledger_version != ledger_version:
+        statements = []
+        extracted_texts = []
+        job_ids = []
+        for uploaded_file, data in zip(uploaded_files, file_bytes):
+            if service_url:
+                with st.spinner(f"📤 Parsing {uploaded_file.name} on the analysis service..."):
+                    try:
+                        # Parse only: the instant summary must not wait on (or fail with) Gemini, so the
+                        # narrative is requested separately on the Main Analysis page.
+                        # Merged statements contribute to the benchmarks once, as one ledger (below)
+                        result = analyze_statement_remote(
+                            service_url, data, None, category_profile,
+                            contribute_benchmarks=not multiple_statements
+                        )
+                    except AnalysisServiceError as e:
+                        st.error(f"❌ Analysis service error for {uploaded_file.name}: {e}")
+                        st.stop()
+                source = result["source"]
+                transactions = result["transactions"]
+                job_ids.append(result["job_id"])
+            else:
+                with st.spinner(f"📄 Extracting text from {uploaded_file.name}..."):
+                    extracted_text = extract_text_from_pdf(uploaded_file)
+                if not extracted_text:
+                    st.error(f"❌ Error extracting text from {uploaded_file.name}. Please check the PDF format.")
+                    st.stop()
+                extracted_texts.append(extracted_text)
+
+                with st.spinner("🔍 Detecting statement source..."):
+                    source = detect_statement_source(extracted_text)
+
+                with st.spinner("🔍 Parsing transaction data..."):
+                    transactions = parse_statement(extracted_text, source, category_profile, workers=os.cpu_count())
+
             if source == "Unknown":
-                st.error("❌ Unsupported statement format. Please upload Paytm or PhonePe statement.")
+                st.error(f"❌ Unsupported statement format in {uploaded_file.name}. Please upload Paytm or PhonePe statement.")
                 st.stop()
-            
-        with st.spinner("🔍 Parsing transaction data..."):
-            if source == "Paytm":
-                transactions = parse_paytm_data(extracted_text)
-            elif source == "PhonePe":
-                transactions = parse_phonepe_data(extracted_text)
-            else:
-                st.error("❌ Unsupported statement format. Please upload Paytm or PhonePe statement.")
-            
             if not transactions:
-                st.error("❌ No transactions found in the statement.")
+                st.error(f"❌ No transactions found in {uploaded_file.name}.")
                 st.stop()
-                
-            st.session_state.transactions = transactions
-            transactions_df = pd.DataFrame(transactions)
-            
-            # Debug: Show parsed data
-            #with st.expander("Debug: View Parsed Transactions"):
-                #st.write(transactions_df)
-            
-            st.session_state.visualizations = generate_visualizations(transactions_df)
-            
-        # Page navigation
-        if page == "Main Analysis":
-            st.markdown("### 🤖 AI Financial Analysis")
-            with st.spinner("🧠 Analyzing financial data..."):
-                if st.session_state.ai_response is None:
-                    ai_analysis = analyze_financial_data(extracted_text, gemini_api_key)
-                    st.session_state.ai_response = ai_analysis
-                st.markdown(f'<div class="analysis-section">{st.session_state.ai_response}</div>', unsafe_allow_html=True)
-                if st.session_state.transactions and st.session_state.ai_response:
-                   st.success("✅ Analysis Complete!")
-
-            st.markdown("### 📥 Download Your Financial Report")
-            
-            if st.session_state.ai_response and st.session_state.visualizations:
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.markdown("#### 📝 Analysis Report")
-                    st.download_button(
-                        label="Download Text Report",
-                        data=st.session_state.ai_response,
-                        file_name="financial_analysis_report.txt",
-                        mime="text/plain"
+            statements.append((source, transactions))
+
+        if multiple_statements:
+            with st.spinner("🔗 Reconciling statements..."):
+                transactions, reconcile_stats = reconcile_statements(statements)
+            # The report is built from the de-duplicated ledger, not the raw statements
+            extracted_text = transactions_to_text(transactions)
+        else:
+            transactions, reconcile_stats = statements[0][1], None
+            # The service does not return the raw text; a later report request uses the parsed rows
+            extracted_text = extracted_texts[0] if extracted_texts else transactions_to_text(transactions)
+
+        st.session_state.ledger_version = ledger_version
+        st.session_state.extracted_text = extracted_text
+        st.session_state.statement_source = " + ".join(dict.fromkeys(source for source, _ in statements))
+        st.session_state.transactions = transactions
+        st.session_state.reconcile_stats = reconcile_stats
+        st.session_state.ai_response = None
+        st.session_state.transaction_index = None
+        st.session_state.category_matcher = get_matcher(category_profile)
+        if ledger:
+            ledger.append(ledger_user, transactions)
+        # Peer benchmarks get anonymous monthly averages only, one contribution per upload: the same
+        # (reconciled) ledger the user's own figures come from. The service ingests single-statement
+        # jobs itself and reconciles multi-statement uploads from their jobs; the digests match its
+        # own, so a statement is never counted twice.
+        if not service_url:
+            benchmark_digest = ledger_version if multiple_statements else hashlib.sha1(file_bytes[0]).hexdigest()
+            if population.add_partial(statement_sketches(transactions), benchmark_digest):
+                population.save()
+        elif multiple_statements:
+            try:
+                submit_benchmark_upload(service_url, job_ids)
+            except AnalysisServiceError as e:
+                st.warning(f"Could not contribute to peer benchmarks: {e}", icon="⚠️")
+
+    # Pick up category mapping edits without re-parsing: only affected rows are re-matched
+    category_matcher = get_matcher(category_profile)
+    previous_matcher = st.session_state.category_matcher
+    if previous_matcher is not category_matcher:
+        recategorize(st.session_state.transactions, previous_matcher, category_matcher)
+        st.session_state.category_matcher = category_matcher
+        st.session_state.transaction_index = None
+    # The on-disk history follows the mapping too. It records the mapping version its categories
+    # came from; if that is not the one this session started with, every stored row is re-matched.
+    if ledger:
+        stored_version = ledger.category_version(ledger_user)
+        if stored_version != category_matcher.version:
+            known = previous_matcher if previous_matcher and previous_matcher.version == stored_version else None
+            with st.spinner("🏷️ Updating categories in the saved ledger..."):
+                ledger.update_rows(ledger_user, lambda rows: recategorize(rows, known, category_matcher))
+            ledger.set_category_version(ledger_user, category_matcher.version)
+
+    st.sidebar.markdown(f"**Detected Source:** <span class='detected-source'>{st.session_state.statement_source}</span>", unsafe_allow_html=True)
+    if st.session_state.reconcile_stats:
+        stats = st.session_state.reconcile_stats
+        st.sidebar.caption(
+            f"🔗 Merged {stats['duplicates_removed']} duplicate and matched "
+            f"{stats['self_transfers']} self-transfer payments across statements"
+        )
+    transactions_df = pd.DataFrame(st.session_state.transactions)
+
+    # Debug: Show parsed data
+    #with st.expander("Debug: View Parsed Transactions"):
+        #st.write(transactions_df)
+
+    # With a persistent ledger the dashboard covers the last 12 months of history
+    chart_source = ledger.view(ledger_user, last_n_months=12) if ledger else transactions_df
+    st.session_state.visualizations = generate_visualizations(chart_source)
+
+    # Page navigation
+    if page == "Main Analysis":
+        # Instant, deterministic summary: no API key or network needed
+        st.markdown("### ⚡ Instant Financial Summary")
+        offline_report = build_offline_report(transactions_df, get_cost_control_suggestions(transactions_df))
+        with st.container(border=True):
+            st.markdown(offline_report)
+
+        st.markdown("### 📥 Download Your Financial Report")
+        col1, col2 = st.columns(2)
+
+        with col1:
+            st.markdown("#### 📝 Analysis Report")
+            st.download_button(
+                label="Download Instant Summary",
+                data=offline_report,
+                file_name="financial_summary.md",
+                mime="text/markdown"
+            )
+            # Filled in once the AI narrative is available
+            ai_download = st.empty()
+
+        with col2:
+            st.markdown("#### 📊 Data Export")
+            export_format = st.selectbox("Export format", list(EXPORT_FORMATS))
+            # Exports are built only on request and cached per ledger and category mapping version
+            export_version = hashlib.sha1(
+                f"{st.session_state.ledger_version}:{category_matcher.version}".encode("utf-8")
+            ).hexdigest()
+            export_path = cached_export(export_version, export_format)
+            if export_path is None and st.button(f"Prepare {export_format} Export"):
+                with st.spinner(f"📦 Writing {export_format} export..."):
+                    export_path = export_transactions(
+                        st.session_state.transactions,
+                        export_format,
+                        export_version
                     )
-                    
-                with col2:
-                    st.markdown("#### 📊 Data Export")
-                    csv = pd.DataFrame(st.session_state.transactions).to_csv(index=False)
+            if export_path:
+                extension, mime = EXPORT_FORMATS[export_format]
+                with open(export_path, "rb") as export_file:
                     st.download_button(
-                        label="Download Transaction Data (CSV)",
-                        data=csv,
-                        file_name="transaction_data.csv",
-                        mime="text/csv"
-                    )                
-                st.markdown("---")    
+                        label=f"Download Transaction Data ({export_format})",
+                        data=export_file,
+                        file_name=f"transaction_data{extension}",
+                        mime=mime
+                    )
+        st.markdown("---")
+
+        # Optional AI narrative, streamed in after the summary is already on screen
+        st.markdown("### 🤖 AI Financial Analysis")
+        if st.session_state.ai_response is None and gemini_api_key:
+            if service_url:
+                with st.spinner("🧠 Analyzing financial data..."):
+                    try:
+                        st.session_state.ai_response = analyze_text_remote(
+                            service_url, st.session_state.extracted_text, gemini_api_key
+                        )
+                    except AnalysisServiceError as e:
+                        st.error(f"❌ Analysis service error: {e}")
+                        st.session_state.ai_response = ""
+                st.markdown(st.session_state.ai_response)
+            else:
+                try:
+                    with st.container(border=True):
+                        st.session_state.ai_response = st.write_stream(
+                            stream_financial_analysis(st.session_state.extracted_text, gemini_api_key)
+                        ) or ""
+                except Exception as e:
+                    st.error(f"Gemini Error: {e}")
+                    st.session_state.ai_response = ""
+        elif st.session_state.ai_response:
+            with st.container(border=True):
+                st.markdown(st.session_state.ai_response)
+        elif not gemini_api_key:
+            st.info("Enter a Gemini API key in the sidebar to add an AI-written analysis to this summary.")
+
+        if st.session_state.ai_response:
+            st.success("✅ Analysis Complete!")
+            ai_download.download_button(
+                label="Download AI Report",
+                data=st.session_state.ai_response,
+                file_name="financial_analysis_report.txt",
+                mime="text/plain"
+            )
+
+    elif page == "Transactions":
+        st.markdown("### 🔎 Transaction Explorer")
+        if st.session_state.transaction_index is None:
+            with st.spinner("⚙️ Indexing transactions..."):
+                st.session_state.transaction_index = TransactionIndex(st.session_state.transactions)
+        index = st.session_state.transaction_index
+
+        first_date, last_date = index.date_bounds
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            date_range = st.date_input("Date range", value=(first_date, last_date)) if first_date else ()
+            search = st.text_input("Search description")
+        with col2:
+            categories = st.multiselect("Category", index.categories)
+            types = st.multiselect("Type", index.types)
+        with col3:
+            # Bounds apply to the size of a payment, so debits and credits are both matched
+            min_amount = st.number_input("Min amount (₹, debit or credit)", value=None, min_value=0.0, step=100.0)
+            max_amount = st.number_input("Max amount (₹, debit or credit)", value=None, min_value=0.0, step=100.0)
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            sort_by = st.selectbox("Sort by", SORTABLE_COLUMNS)
+        with col2:
+            ascending = st.radio("Order", ["Ascending", "Descending"], horizontal=True) == "Ascending"
+        with col3:
+            page_size = st.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+
+        # The picker starts at the full range; only an edited bound filters, so undated rows stay visible by default
+        rows = index.filter(
+            start=date_range[0] if len(date_range) > 0 and date_range[0] != first_date else None,
+            end=date_range[1] if len(date_range) > 1 and date_range[1] != last_date else None,
+            categories=categories,
+            types=types,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            search=search,
+        )
+        rows = index.sort(rows, by=sort_by, ascending=ascending)
+        page_count = max(1, math.ceil(len(rows) / page_size))
+        page_number = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1)
+
+        st.caption(f"{len(rows):,} of {len(index):,} transactions match")
+        st.dataframe(
+            index.page(rows, page_number, page_size, DISPLAY_COLUMNS),
+            hide_index=True,
+            use_container_width=True
+        )
+
+    elif page == "Visualizations":
+        st.markdown("### 📊 Transaction Visualizations")
+        if st.session_state.visualizations:
+            tab1, tab2, tab3, tab4 = st.tabs(["Spending Overview", "Monthly Trends", "Top Expenses", "Daily Patterns"])
+            
+            with tab1:
+                if 'category_pie' in st.session_state.visualizations:
+                    st.plotly_chart(st.session_state.visualizations['category_pie'], use_container_width=True)
+                    st.markdown("""
+                    **Insights:**
+                    - This pie chart shows how your spending is distributed across different categories
+                    - Identify which categories consume the largest portion of your budget
+                    - Hover over sections to see exact amounts and percentages
+                    """)
+                else:
+                    st.warning("No category data available for visualization")
                 
-        elif page == "Visualizations":
-            st.markdown("### 📊 Transaction Visualizations")
-            if st.session_state.visualizations:
-                tab1, tab2, tab3, tab4 = st.tabs(["Spending Overview", "Monthly Trends", "Top Expenses", "Daily Patterns"])
+            with tab2:
+                if 'monthly_spending' in st.session_state.visualizations:
+                    st.plotly_chart(st.session_state.visualizations['monthly_spending'], use_container_width=True)
+                    st.markdown("""
+                    **Insights:**
+                    - Track your monthly spending patterns
+                    - Identify months with unusually high or low spending
+                    - Look for seasonal trends in your expenses
+                    """)
+                else:
+                    st.warning("No monthly spending data available for visualization")
                 
-                with tab1:
-                    if 'category_pie' in st.session_state.visualizations:
-                        st.plotly_chart(st.session_state.visualizations['category_pie'], use_container_width=True)
-                        st.markdown("""
-                        **Insights:**
-                        - This pie chart shows how your spending is distributed across different categories
-                        - Identify which categories consume the largest portion of your budget
-                        - Hover over sections to see exact amounts and percentages
-                        """)
-                    else:
-                        st.warning("No category data available for visualization")
-                    
-                with tab2:
-                    if 'monthly_spending' in st.session_state.visualizations:
-                        st.plotly_chart(st.session_state.visualizations['monthly_spending'], use_container_width=True)
-                        st.markdown("""
-                        **Insights:**
-                        - Track your monthly spending patterns
-                        - Identify months with unusually high or low spending
-                        - Look for seasonal trends in your expenses
-                        """)
-                    else:
-                        st.warning("No monthly spending data available for visualization")
-                    
-                with tab3:
-                    if 'top_expenses' in st.session_state.visualizations:
-                        st.plotly_chart(st.session_state.visualizations['top_expenses'], use_container_width=True)
-                        st.markdown("""
-                        **Insights:**
-                        - These are your largest individual transactions
-                        - Review if these were necessary expenses or potential areas for savings
-                        - Note any recurring large expenses that could be optimized
-                        """)
-                    else:
-                        st.warning("No top expenses data available for visualization")
-                    
-                with tab4:
-                    if 'daily_spending' in st.session_state.visualizations:
-                        st.plotly_chart(st.session_state.visualizations['daily_spending'], use_container_width=True)
-                        st.markdown("""
-                        **Insights:**
-                        - Shows which days of the week you spend the most
-                        - Weekend spending patterns often differ from weekdays
-                        - Helps identify habitual spending behaviors
-                        """)
-                    else:
-                        st.warning("No daily spending data available for visualization")
-                              
-        elif page == "Cost Control Suggestions":
-            st.markdown("### 🧠 Cost Control Suggestions")
-            if st.session_state.transactions:
-                suggestions_df = get_cost_control_suggestions(pd.DataFrame(st.session_state.transactions))
+            with tab3:
+                if 'top_expenses' in st.session_state.visualizations:
+                    st.plotly_chart(st.session_state.visualizations['top_expenses'], use_container_width=True)
+                    st.markdown("""
+                    **Insights:**
+                    - These are your largest individual transactions
+                    - Review if these were necessary expenses or potential areas for savings
+                    - Note any recurring large expenses that could be optimized
+                    """)
+                else:
+                    st.warning("No top expenses data available for visualization")
                 
+            with tab4:
+                if 'daily_spending' in st.session_state.visualizations:
+                    st.plotly_chart(st.session_state.visualizations['daily_spending'], use_container_width=True)
+                    st.markdown("""
+                    **Insights:**
+                    - Shows which days of the week you spend the most
+                    - Weekend spending patterns often differ from weekdays
+                    - Helps identify habitual spending behaviors
+                    """)
+                else:
+                    st.warning("No daily spending data available for visualization")
+                          
+    elif page == "Budget & Forecast":
+        st.markdown("### 🎯 Budget & Forecast")
+        # The whole ledger history feeds the models, so seasonality is picked up after two years
+        forecast = forecast_spending(ledger.view(ledger_user) if ledger else transactions_df)
+        if forecast.empty:
+            st.warning("No dated spending found to forecast")
+        else:
+            progress = forecast.attrs["progress"]
+            if progress < 1.0:
+                st.caption(f"Tracking {forecast.attrs['month']}: {progress:.0%} of the month has passed. "
+                           "Projected = spent so far + forecast for the rest of the month.")
+            else:
+                st.caption(f"Forecast for {forecast.attrs['month']}, based on {len(forecast)} categories of past spending.")
+
+            st.markdown("#### ✏️ Monthly Budgets")
+            budget_df = st.data_editor(
+                check_budgets(forecast, st.session_state.budgets)[["Category", "Forecast", "Budget"]],
+                column_config={
+                    "Forecast": st.column_config.NumberColumn("Forecast (₹)", format="₹%.0f", disabled=True),
+                    "Budget": st.column_config.NumberColumn("Budget (₹)", min_value=0.0, step=500.0, format="₹%.0f"),
+                },
+                disabled=["Category"],
+                hide_index=True,
+                use_container_width=True,
+                key="budget_editor"
+            )
+            st.session_state.budgets = {
+                row.Category: row.Budget for row in budget_df.itertuples() if pd.notna(row.Budget) and row.Budget > 0
+            }
+
+            status_df = check_budgets(forecast, st.session_state.budgets)
+            for row in status_df[status_df["Status"].isin(["Over budget", "On track to overspend"])].itertuples():
+                st.error(f"🚨 {row.Category}: {row.Status.lower()} - projected ₹{row.Projected:,.0f} against a budget of ₹{row.Budget:,.0f}")
+            for row in status_df[status_df["Status"] == "Close to budget"].itertuples():
+                st.warning(f"⚠️ {row.Category}: projected ₹{row.Projected:,.0f} is close to the budget of ₹{row.Budget:,.0f}")
+
+            fig_forecast = px.bar(
+                status_df.melt(id_vars="Category", value_vars=["Month To Date", "Projected", "Budget"],
+                               var_name="Measure", value_name="Amount"),
+                x="Category",
+                y="Amount",
+                color="Measure",
+                barmode="group",
+                title=f"Projected Spending vs Budget ({forecast.attrs['month']})",
+                labels={'Amount': 'Amount (₹)'}
+            )
+            st.plotly_chart(fig_forecast, use_container_width=True)
+
+            st.dataframe(
+                status_df,
+                column_config={
+                    column: st.column_config.NumberColumn(format="₹%.2f")
+                    for column in ["Last Month", "Month To Date", "Forecast", "Projected", "Budget"]
+                },
+                hide_index=True,
+                use_container_width=True
+            )
+
+    elif page == "Cost Control Suggestions":
+        st.markdown("### 🧠 Cost Control Suggestions")
+        if st.session_state.transactions:
+            suggestions_df = get_cost_control_suggestions(
+                ledger.view(ledger_user, last_n_months=12) if ledger else pd.DataFrame(st.session_state.transactions)
+            )
+            
+            st.dataframe(
+                suggestions_df,
+                column_config={
+                    "Category": "Category",
+                    "Amount": "Amount Spent",
+                    "Suggestion": "Recommendation",
+                    "Potential Savings": "Estimated Savings"
+                },
+                hide_index=True,
+                use_container_width=True
+            )
+            
+            st.markdown("#### 📈 How You Compare")
+            try:
+                peer_tables = get_benchmarks(service_url) if service_url else population.tables()
+            except AnalysisServiceError as e:
+                st.error(f"❌ Could not load peer benchmarks: {e}")
+                peer_tables = {}
+            comparison = compare_to_peers(pd.DataFrame(st.session_state.transactions), peer_tables)
+            if comparison:
+                for row in comparison:
+                    message = (f"Your {row['Category']} spend (₹{row['Your Monthly Spend']:,.0f}/month) "
+                               f"is in the {_ordinal(row['Peer Percentile'])} percentile of users")
+                    if row["Peer Percentile"] >= 75:
+                        st.warning(f"⚠️ {message}")
+                    else:
+                        st.info(f"📊 {message}")
                 st.dataframe(
-                    suggestions_df,
+                    pd.DataFrame(comparison),
                     column_config={
-                        "Category": "Category",
-                        "Amount": "Amount Spent",
-                        "Suggestion": "Recommendation",
-                        "Potential Savings": "Estimated Savings"
+                        "Your Monthly Spend": st.column_config.NumberColumn(format="₹%.2f"),
+                        "Peer Median": st.column_config.NumberColumn("Peer Median (monthly)", format="₹%.2f"),
                     },
                     hide_index=True,
                     use_container_width=True
                 )
-                
-                st.markdown("---")
-                st.markdown("#### 💡 Implementation Tips")
-                st.markdown("""
-                - **Start small**: Focus on one or two categories at a time
-                - **Track progress**: Compare monthly spending after implementing changes
-                - **Automate savings**: Set up automatic transfers to savings when you reduce expenses
-                - **Review regularly**: Reassess your spending patterns every 3 months
-                """)
-                
-    else:
-        st.error("❌ Error extracting text from PDF. Please check the PDF format.")
+                st.caption("Benchmarks are anonymous: only each upload's average monthly spend per category is pooled, "
+                           "never user ids.")
+            else:
+                st.caption("Not enough statements from other users yet to benchmark your spending.")
+
+            st.markdown("---")
+            st.markdown("#### 💡 Implementation Tips")
+            st.markdown("""
+            - **Start small**: Focus on one or two categories at a time
+            - **Track progress**: Compare monthly spending after implementing changes
+            - **Automate savings**: Set up automatic transfers to savings when you reduce expenses
+            - **Review regularly**: Reassess your spending patterns every 3 months
+            """)
+            
 else:
     if page != "Main Analysis":
-        st.sidebar.warning("Please upload a PDF and provide your Gemini API key to access this page.")
+        st.sidebar.warning("Please upload at least one PDF to access this page.")
 
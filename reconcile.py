@@ -0,0 +1,142 @@
+# Cross-source reconciliation of Paytm and PhonePe statements
+#
+# Statements for the same bank account overlap: one UPI payment appears in
+# both apps, and a transfer between the user's own accounts shows up as a
+# debit in one and a credit in the other. Rows are matched first with a hash
+# join on the UTR / UPI Ref No, then the remainder with a sort-merge join on
+# (amount, timestamp within a window).
+from datetime import datetime, timedelta
+
+MATCH_WINDOW = timedelta(minutes=10)
+_FILL_FIELDS = ("Transaction_ID", "UTR", "Description", "Full_Date", "Parsed_Date")
+
+
+def _utr_key(transaction):
+    utr = str(transaction.get("UTR") or "").strip().upper()
+    return utr or None
+
+
+def _amount_key(transaction):
+    # Whole paise, so float noise never splits a match
+    return round(abs(float(transaction.get("Amount") or 0.0)) * 100)
+
+
+def _direction(transaction):
+    return "Debit" if float(transaction.get("Amount") or 0.0) < 0 else "Credit"
+
+
+def _timestamp(transaction):
+    value = transaction.get("Parsed_Date")
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return value
+
+
+class _Reconciler:
+    def __init__(self, window):
+        self.window = window
+        self.rows = []
+        self.duplicate_of = {}  # row index -> kept row index
+        self.matched = set()
+        self.stats = {"input_rows": 0, "utr_matches": 0, "fallback_matches": 0,
+                      "duplicates_removed": 0, "self_transfers": 0}
+
+    def add(self, statement_index, source, transactions):
+        for transaction in transactions:
+            row = dict(transaction)
+            row["Source"] = source
+            row["_statement"] = statement_index
+            self.rows.append(row)
+        self.stats["input_rows"] += len(transactions)
+
+    def _pair(self, a, b, how):
+        """Record a match between rows a and b (a from the earlier statement)."""
+        self.matched.update((a, b))
+        self.stats[how] += 1
+        kept, other = self.rows[a], self.rows[b]
+        if _direction(kept) == _direction(other):
+            # The same payment seen by both apps: keep one row, fill its gaps
+            for field in _FILL_FIELDS:
+                if not kept.get(field) and other.get(field):
+                    kept[field] = other[field]
+            kept["Source"] = f"{kept['Source']} + {other['Source']}"
+            self.duplicate_of[b] = a
+            self.stats["duplicates_removed"] += 1
+        else:
+            # Money leaving one of the user's accounts and arriving in another
+            for row in (kept, other):
+                row["Category"] = "Transfer"
+                row["Self_Transfer"] = True
+            self.stats["self_transfers"] += 1
+
+    def hash_join(self):
+        first_seen = {}
+        for index, row in enumerate(self.rows):
+            key = _utr_key(row)
+            if key is None:
+                continue
+            if key not in first_seen:
+                first_seen[key] = index
+                continue
+            other = first_seen[key]
+            if other in self.matched or self.rows[other]["_statement"] == row["_statement"]:
+                continue
+            self._pair(other, index, "utr_matches")
+
+    def sort_merge_join(self):
+        candidates = []
+        for index, row in enumerate(self.rows):
+            timestamp = _timestamp(row)
+            if index not in self.matched and timestamp is not None:
+                candidates.append((_amount_key(row), timestamp, index))
+        candidates.sort()
+
+        for position, (amount, timestamp, index) in enumerate(candidates):
+            if index in self.matched:
+                continue
+            row = self.rows[index]
+            # Scan forward only while the amount is equal and the time is inside the window
+            for next_position in range(position + 1, len(candidates)):
+                other_amount, other_time, other = candidates[next_position]
+                if other_amount != amount or other_time - timestamp > self.window:
+                    break
+                if other in self.matched or self.rows[other]["_statement"] == row["_statement"]:
+                    continue
+                other_utr, utr = _utr_key(self.rows[other]), _utr_key(row)
+                if utr and other_utr and utr != other_utr:
+                    continue
+                # Without a shared UTR, a debit/credit pair only counts as a self-transfer
+                # when the keywords already marked one side as a transfer
+                if (_direction(row) != _direction(self.rows[other])
+                        and "Transfer" not in (row.get("Category"), self.rows[other].get("Category"))):
+                    continue
+                first, second = sorted((index, other), key=lambda i: (self.rows[i]["_statement"], i))
+                self._pair(first, second, "fallback_matches")
+                break
+
+    def ledger(self):
+        rows = [row for index, row in enumerate(self.rows) if index not in self.duplicate_of]
+        for row in rows:
+            del row["_statement"]
+        rows.sort(key=lambda row: (_timestamp(row) is None, _timestamp(row) or datetime.min))
+        return rows
+
+
+def reconcile_statements(statements, window=MATCH_WINDOW):
+    """Merge several parsed statements into one de-duplicated ledger.
+
+    `statements` is a list of (source, transactions) pairs in upload order.
+    Returns (transactions, stats). Each output row carries a "Source"
+    column; rows matched across statements are merged into one when they
+    are the same payment, or both kept and flagged Self_Transfer when money
+    moved between the user's own accounts.
+    """
+    reconciler = _Reconciler(window)
+    for statement_index, (source, transactions) in enumerate(statements):
+        reconciler.add(statement_index, source, transactions)
+    reconciler.hash_join()
+    reconciler.sort_merge_join()
+    return reconciler.ledger(), reconciler.stats
@@ -0,0 +1,203 @@
+# Report generation: instant template report and the Gemini narrative
+import google.generativeai as genai
+import pandas as pd
+from google.ai import generativelanguage as glm
+
+from ledger_store import without_self_transfers
+
+# Passing this as the API key returns a canned report without calling Gemini,
+# which keeps the app and the analysis service testable offline.
+STUB_API_KEY = "stub"
+GEMINI_MODEL = "models/gemini-1.5-flash"
+
+def _build_prompt(text):
+    return f"""
+You are a certified financial advisor. Review the following UPI transaction data and create a detailed, professional financial analysis report.
+**Guidelines:**
+- Base your analysis only on the provided UPI transaction data.
+- Use clear structure (headings, bullet points) and a professional tone.
+- Include specific amounts from transactions in your analysis.
+- Highlight key spending categories and patterns.
+- Provide concrete recommendations with actionable steps.
+- Avoid Disclaimers and Data Insuffcient
+
+**Report Sections to Include**:
+1. **Executive Summary**
+   - Overview of financial activity.
+   - Key highlights.
+2. **Income vs. Expenses**
+   - Total credit vs. debit amounts.
+   - Net cash flow (savings or overspending).
+3. **Transaction Summary**
+   - Count of credit/debit transactions.
+   - Notable inflows/outflows.
+4. **Spending Pattern Analysis**
+   - Top categories and merchants.
+   - Recurring patterns (e.g., OTT, food delivery).
+5. **Spending Efficiency & Potential Wastage**
+   - Any inefficient or avoidable expense trends.
+6. **Savings & Budget Recommendations**
+   - Practical advice to reduce spending and improve financial health.
+7. **Conclusion & Strategy**
+   - Final insights with actionable tips.
+Transaction History:
+{text}
+        """
+
+def _gemini_request(text, api_key):
+    """A Gemini client for this key only, and the report request.
+
+    genai.configure() would replace the process-wide default client, which
+    the analysis service shares between concurrent requests made with
+    different users' keys.
+    """
+    client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+    request = glm.GenerateContentRequest(
+        model=GEMINI_MODEL,
+        contents=[glm.Content(role="user", parts=[glm.Part(text=_build_prompt(text))])],
+    )
+    return client, request
+
+# �🧑‍💼 Analyze financial data using Gemini
+def analyze_financial_data(text, api_key):
+    """Return the Gemini report. Gemini errors propagate to the caller (the service marks the job failed)."""
+    if api_key == STUB_API_KEY:
+        return stub_financial_report(text)
+    client, request = _gemini_request(text, api_key)
+    response = genai.types.GenerateContentResponse.from_response(client.generate_content(request))
+    return response.text.strip()
+
+def stream_financial_analysis(text, api_key):
+    """Yield the Gemini report in chunks as they arrive (for st.write_stream).
+
+    Gemini errors propagate to the caller, which decides how to show them.
+    """
+    if api_key == STUB_API_KEY:
+        for line in stub_financial_report(text).splitlines(keepends=True):
+            yield line
+        return
+    client, request = _gemini_request(text, api_key)
+    for chunk in client.stream_generate_content(request):
+        chunk_text = genai.types.GenerateContentResponse.from_response(chunk).text
+        if chunk_text:
+            yield chunk_text
+
+def stub_financial_report(text):
+    """Deterministic stand-in for the Gemini report, used for local testing."""
+    line_count = len([line for line in text.splitlines() if line.strip()])
+    return (
+        "## Financial Analysis Report (stub)\n\n"
+        "This report was produced by the offline stub model, not by Gemini.\n\n"
+        f"- Statement lines reviewed: {line_count}"
+    )
+
+def transactions_to_text(transactions):
+    """Render a reconciled ledger as compact text for the report prompt.
+
+    Used instead of the raw statement text when several statements were
+    merged, so payments seen by both apps are not reported twice.
+    """
+    lines = ["Date | Description | Amount (INR) | Type | Category | Source"]
+    for t in transactions:
+        lines.append(" | ".join(str(t.get(field) or "") for field in
+                                ("Full_Date", "Description", "Amount", "Type", "Category", "Source")))
+    return "\n".join(lines)
+
+def _inr(amount):
+    return f"₹{amount:,.2f}"
+
+def build_offline_report(transactions, suggestions_df=None, top_n=5):
+    """Fill the seven report sections straight from the parsed transactions.
+
+    Needs no API key and no network, so it renders as soon as parsing is
+    done. `suggestions_df` is the output of get_cost_control_suggestions.
+    """
+    df = transactions if isinstance(transactions, pd.DataFrame) else pd.DataFrame(transactions)
+    if df.empty or "Amount" not in df.columns:
+        return "## Financial Summary\n\nNo transactions available."
+    transfers = len(df) - len(without_self_transfers(df))
+    # Money moved between the user's own accounts is neither income nor spending
+    df = without_self_transfers(df).copy()
+    for column, default in (("Parsed_Date", None), ("Description", ""), ("Category", "Other")):
+        if column not in df.columns:
+            df[column] = default
+    df["Amount"] = pd.to_numeric(df["Amount"], errors="coerce").fillna(0.0)
+    df["Parsed_Date"] = pd.to_datetime(df["Parsed_Date"], errors="coerce")
+    df["Description"] = df["Description"].fillna("").replace("", "Unknown")
+    df["Category"] = df["Category"].fillna("Other")
+
+    credits = df[df["Amount"] > 0]
+    debits = df[df["Amount"] < 0].assign(Spent=lambda d: d["Amount"].abs())
+    total_in = credits["Amount"].sum()
+    total_out = debits["Spent"].sum()
+    net = total_in - total_out
+    dated = df["Parsed_Date"].dropna()
+    period = (f"{dated.min():%d %b %Y} – {dated.max():%d %b %Y}" if not dated.empty else "the statement period")
+
+    by_category = debits.groupby("Category")["Spent"].sum().sort_values(ascending=False)
+    by_merchant = debits.groupby("Description")["Spent"].agg(["sum", "count"]).sort_values("sum", ascending=False)
+    months = debits["Parsed_Date"].dt.to_period("M")
+    merchant_months = debits.assign(Month=months).groupby("Description")["Month"].nunique()
+    recurring = merchant_months[merchant_months >= 2].index
+    small = debits[debits["Spent"] < 200]
+
+    lines = ["## Financial Summary (instant)", ""]
+
+    lines += ["### 1. Executive Summary",
+              f"- {len(df)} transactions between {period}.",
+              f"- Money in: **{_inr(total_in)}**, money out: **{_inr(total_out)}**."]
+    if transfers:
+        lines.append(f"- {transfers} transfers between your own accounts are left out of the totals.")
+    if not by_category.empty:
+        lines.append(f"- Largest spending category: **{by_category.index[0]}** ({_inr(by_category.iloc[0])}).")
+
+    lines += ["", "### 2. Income vs. Expenses",
+              f"- Total credits: {_inr(total_in)}",
+              f"- Total debits: {_inr(total_out)}",
+              f"- Net cash flow: **{_inr(net)}** ({'savings' if net >= 0 else 'overspending'})"]
+    if total_in > 0:
+        lines.append(f"- Savings rate: {net / total_in:.1%} of income")
+
+    lines += ["", "### 3. Transaction Summary",
+              f"- Credit transactions: {len(credits)}",
+              f"- Debit transactions: {len(debits)}"]
+    if not credits.empty:
+        top_in = credits.loc[credits["Amount"].idxmax()]
+        lines.append(f"- Largest inflow: {_inr(top_in['Amount'])} from {top_in['Description']}")
+    if not debits.empty:
+        top_out = debits.loc[debits["Spent"].idxmax()]
+        lines.append(f"- Largest outflow: {_inr(top_out['Spent'])} to {top_out['Description']}")
+
+    lines += ["", "### 4. Spending Pattern Analysis", "**Top categories:**"]
+    for category, amount in by_category.head(top_n).items():
+        lines.append(f"- {category}: {_inr(amount)} ({amount / total_out:.1%} of spending)")
+    lines.append("**Top merchants:**")
+    for merchant, row in by_merchant.head(top_n).iterrows():
+        count = int(row["count"])
+        lines.append(f"- {merchant}: {_inr(row['sum'])} across {count} payment{'s' if count != 1 else ''}")
+    if len(recurring):
+        lines.append(f"- Recurring payees (paid in 2+ months): {', '.join(recurring[:top_n])}")
+
+    lines += ["", "### 5. Spending Efficiency & Potential Wastage"]
+    if not small.empty:
+        lines.append(f"- {len(small)} small payments under ₹200 add up to {_inr(small['Spent'].sum())}.")
+    if "Other" in by_category:
+        lines.append(f"- {_inr(by_category['Other'])} of spending is uncategorized; review it for avoidable expenses.")
+    if small.empty and "Other" not in by_category:
+        lines.append("- No obvious small-ticket or uncategorized leakage detected.")
+
+    lines += ["", "### 6. Savings & Budget Recommendations"]
+    if suggestions_df is not None and not suggestions_df.empty:
+        for _, row in suggestions_df.iterrows():
+            lines.append(f"- **{row['Category']}** ({row['Amount']}): {row['Suggestion']} {row['Potential Savings']}")
+    else:
+        lines.append("- Keep tracking spending monthly and set a budget for your top category.")
+
+    lines += ["", "### 7. Conclusion & Strategy"]
+    if net >= 0:
+        lines.append(f"- You saved {_inr(net)} over this period; move it to savings or investments automatically.")
+    else:
+        lines.append(f"- You spent {_inr(-net)} more than you received; cut back first on the categories above.")
+    if not by_category.empty:
+        lines.append(f"- Focus on **{by_category.index[0]}** first: it is your largest lever.")
+    return "\n".join(lines)
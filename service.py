@@ -0,0 +1,353 @@
+# Headless HTTP analysis service
+#
+# Run with:  uvicorn service:app --port 8000
+#
+# Statements are submitted as jobs. A bounded queue feeds a fixed number of
+# parse workers, which hand PDF extraction and parsing to a process pool so a
+# large statement never blocks the event loop. Gemini calls run afterwards on
+# a separate, smaller thread pool, so slow LLM responses do not hold up
+# parsing for other users. Each parse worker also returns a partial peer
+# benchmark sketch for its statement, merged here into the population
+# sketches served by GET /benchmarks. Uploads of several statements are
+# reconciled here from their jobs and contribute once, as one ledger.
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+
+from statement_parser import parse_pdf_bytes
+from report_generator import analyze_financial_data
+from benchmarks import MIN_CONTRIBUTORS, BenchmarkStore, statement_sketches
+from reconcile import reconcile_statements
+
+PARSE_WORKERS = int(os.environ.get("UPI_PARSE_WORKERS", os.cpu_count() or 2))
+LLM_WORKERS = int(os.environ.get("UPI_LLM_WORKERS", 4))
+MAX_QUEUED_JOBS = int(os.environ.get("UPI_MAX_QUEUED_JOBS", 100))
+MAX_STORED_JOBS = int(os.environ.get("UPI_MAX_STORED_JOBS", 1000))
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+MAX_UPLOAD_STATEMENTS = 10  # statements one multi-statement benchmark contribution may combine
+
+def parse_and_sketch(pdf_bytes, user_id=None):
+    """parse_pdf_bytes() plus the statement's partial benchmark sketches (no user id in them)."""
+    text, source, transactions = parse_pdf_bytes(pdf_bytes, user_id)
+    return text, source, transactions, statement_sketches(transactions) if transactions else {}
+
+
+QUEUED, PARSING, ANALYZING, DONE, FAILED = "queued", "parsing", "analyzing", "done", "failed"
+
+
+class Job:
+    def __init__(self, pdf_bytes, api_key, user_id=None, contribute_benchmarks=True):
+        self.id = uuid.uuid4().hex
+        self.pdf_bytes = pdf_bytes
+        self.api_key = api_key
+        self.user_id = user_id
+        self.contribute_benchmarks = contribute_benchmarks
+        self.benchmarks_claimed = False  # set once the job is part of a multi-statement contribution
+        self.ledger_version = hashlib.sha1(pdf_bytes).hexdigest()
+        self.status = QUEUED
+        self.error = None
+        self.source = None
+        self.transactions = None
+        self.report = None
+        self.created = time.time()
+        self.finished = None
+
+    def summary(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "source": self.source,
+            "ledger_version": self.ledger_version,
+            "transaction_count": len(self.transactions) if self.transactions is not None else None,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class JobManager:
+    """Job queue, job registry and the worker pools that process them."""
+
+    def __init__(self, parse_workers=PARSE_WORKERS, llm_workers=LLM_WORKERS,
+                 max_queued=MAX_QUEUED_JOBS, max_stored=MAX_STORED_JOBS, benchmarks=None):
+        self.parse_workers = parse_workers
+        self.llm_workers = llm_workers
+        self.max_stored = max_stored
+        self.queue = asyncio.Queue(maxsize=max_queued)
+        self.jobs = OrderedDict()
+        self._process_pool = None
+        self._llm_pool = None
+        self._tasks = []
+        self._analysis_tasks = set()
+        self.benchmarks = benchmarks if benchmarks is not None else BenchmarkStore.load()
+
+    def _new_process_pool(self):
+        # "spawn" rather than fork: the event loop and LLM threads already exist at this point
+        return ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_broken_pool(self, pool):
+        """Swap in a fresh process pool after a parse process died (e.g. out of memory)."""
+        # Every worker that was using the broken pool ends up here; only the first replaces it
+        if self._process_pool is pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = self._new_process_pool()
+
+    async def start(self):
+        self._process_pool = self._new_process_pool()
+        self._llm_pool = ThreadPoolExecutor(max_workers=self.llm_workers, thread_name_prefix="llm")
+        self._tasks = [asyncio.create_task(self._parse_worker()) for _ in range(self.parse_workers)]
+
+    async def stop(self):
+        tasks = self._tasks + list(self._analysis_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._process_pool.shutdown(cancel_futures=True)
+        self._llm_pool.shutdown(cancel_futures=True)
+        self.benchmarks.save()
+
+    def _check_capacity(self):
+        # Statements waiting to be parsed and reports waiting for Gemini share one bound
+        if self.queue.maxsize and self.queue.qsize() + len(self._analysis_tasks) >= self.queue.maxsize:
+            raise asyncio.QueueFull
+
+    def submit(self, pdf_bytes, api_key=None, user_id=None, contribute_benchmarks=True):
+        self._check_capacity()  # raises asyncio.QueueFull when saturated
+        job = Job(pdf_bytes, api_key, user_id, contribute_benchmarks)
+        self.queue.put_nowait(job)
+        self.jobs[job.id] = job
+        self._evict()
+        return job
+
+    def submit_report(self, text, api_key):
+        """Queue only the report step for an already parsed (e.g. reconciled) ledger."""
+        self._check_capacity()
+        job = Job(text.encode("utf-8"), api_key)
+        job.pdf_bytes = None
+        job.status = ANALYZING
+        self.jobs[job.id] = job
+        self._evict()
+        self._start_analysis(job, text)
+        return job
+
+    async def contribute_upload(self, job_ids):
+        """Add one benchmark contribution for several parsed statements uploaded together.
+
+        The jobs must have been submitted with benchmarks skipped. Their
+        transactions are reconciled into one ledger, exactly as the app does,
+        so the upload counts once. Returns False if it was already counted.
+        """
+        if not 2 <= len(job_ids) <= MAX_UPLOAD_STATEMENTS or len(set(job_ids)) != len(job_ids):
+            raise ValueError(f"An upload combines 2 to {MAX_UPLOAD_STATEMENTS} different jobs")
+        jobs = [self.jobs.get(job_id) for job_id in job_ids]
+        if any(job is None for job in jobs):
+            raise KeyError("Unknown job")
+        for job in jobs:
+            if job.status != DONE or job.transactions is None or job.source in (None, "Unknown"):
+                raise ValueError(f"Job {job.id} has no parsed statement")
+            if job.contribute_benchmarks or job.benchmarks_claimed:
+                raise ValueError(f"Job {job.id} is already part of the benchmarks")
+        for job in jobs:
+            job.benchmarks_claimed = True
+
+        statements = [(job.source, job.transactions) for job in jobs]
+        transactions, _ = await asyncio.to_thread(reconcile_statements, statements)
+        # Same digest the app computes for a multi-statement upload
+        digest = hashlib.sha1(b"".join(bytes.fromhex(job.ledger_version) for job in jobs)).hexdigest()
+        accepted = self.benchmarks.add_partial(statement_sketches(transactions), digest)
+        if accepted:
+            self.benchmarks.save()
+        return accepted
+
+    def _evict(self):
+        # Drop the oldest finished jobs once the registry is full
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.max_stored:
+                break
+            if self.jobs[job_id].status in (DONE, FAILED):
+                del self.jobs[job_id]
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.finished = time.time()
+        job.pdf_bytes = None
+
+    async def _parse_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            pool = self._process_pool
+            try:
+                job.status = PARSING
+                text, source, transactions, partial = await loop.run_in_executor(
+                    pool, parse_and_sketch, job.pdf_bytes, job.user_id
+                )
+                job.source = source
+                job.transactions = transactions
+                if (job.contribute_benchmarks and source != "Unknown"
+                        and self.benchmarks.add_partial(partial, job.ledger_version)):
+                    self.benchmarks.save()
+                if not text:
+                    self._finish(job, FAILED, "Could not extract text from PDF")
+                elif source == "Unknown":
+                    self._finish(job, FAILED, "Unsupported statement format")
+                elif job.api_key:
+                    job.status = ANALYZING
+                    # Analysis runs in its own task so this worker can take the next statement
+                    self._start_analysis(job, text)
+                else:
+                    self._finish(job, DONE)
+            except BrokenProcessPool:
+                self._replace_broken_pool(pool)
+                self._finish(job, FAILED, "Parsing failed: a parse process died (is the statement too large?)")
+            except Exception as e:
+                self._finish(job, FAILED, f"Parsing failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _start_analysis(self, job, text):
+        task = asyncio.create_task(self._analyze(job, text))
+        self._analysis_tasks.add(task)
+        task.add_done_callback(self._analysis_tasks.discard)
+
+    async def _analyze(self, job, text):
+        loop = asyncio.get_running_loop()
+        try:
+            job.report = await loop.run_in_executor(self._llm_pool, analyze_financial_data, text, job.api_key)
+            self._finish(job, DONE)
+        except Exception as e:
+            self._finish(job, FAILED, f"Analysis failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.jobs = JobManager()
+    await app.state.jobs.start()
+    yield
+    await app.state.jobs.stop()
+
+
+app = FastAPI(title="UPI Financial Analyzer API", lifespan=lifespan)
+
+
+def _get_job(request, job_id):
+    job = request.app.state.jobs.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+
+@app.get("/health")
+async def health(request: Request):
+    manager = request.app.state.jobs
+    return {"status": "ok", "queued": manager.queue.qsize(), "jobs": len(manager.jobs)}
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: Request):
+    """Upload a statement PDF as the raw request body.
+
+    The Gemini API key is read from the X-Gemini-Api-Key header; without it
+    the job only parses the statement. X-User-Id selects per-user category
+    overrides. X-Skip-Benchmarks: 1 keeps the statement out of the peer
+    benchmarks, for clients that merge several statements and then pass
+    their jobs to POST /benchmarks/uploads instead.
+    """
+    pdf_bytes = await request.body()
+    if not pdf_bytes:
+        raise HTTPException(status_code=400, detail="Request body must contain the statement PDF")
+    if len(pdf_bytes) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Statement is too large")
+    try:
+        job = request.app.state.jobs.submit(
+            pdf_bytes,
+            request.headers.get("X-Gemini-Api-Key"),
+            request.headers.get("X-User-Id"),
+            request.headers.get("X-Skip-Benchmarks", "").lower() not in ("1", "true", "yes"),
+        )
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Job queue is full, retry later")
+    return job.summary()
+
+
+@app.post("/reports", status_code=202)
+async def create_report(request: Request):
+    """Generate a report from plain transaction text, e.g. a reconciled multi-statement ledger."""
+    text = (await request.body()).decode("utf-8", errors="replace")
+    api_key = request.headers.get("X-Gemini-Api-Key")
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="Request body must contain the transaction text")
+    if not api_key:
+        raise HTTPException(status_code=400, detail="X-Gemini-Api-Key header is required")
+    try:
+        job = request.app.state.jobs.submit_report(text, api_key)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Job queue is full, retry later")
+    return job.summary()
+
+
+@app.get("/benchmarks")
+async def benchmarks(request: Request):
+    """Peer percentile tables of monthly spend per category (0th..100th percentile).
+
+    Categories with fewer than MIN_CONTRIBUTORS contributing statements are left out.
+    """
+    tables = request.app.state.jobs.benchmarks.tables()
+    return {
+        "min_contributors": MIN_CONTRIBUTORS,
+        "categories": {category: table.to_dict() for category, table in tables.items()},
+    }
+
+
+@app.post("/benchmarks/uploads", status_code=202)
+async def contribute_upload(request: Request):
+    """Contribute several statements uploaded together: {"job_ids": [...]}, in upload order.
+
+    The jobs must be finished and submitted with X-Skip-Benchmarks: 1. The
+    service reconciles their parsed transactions itself, so clients never
+    send benchmark figures of their own.
+    """
+    try:
+        body = await request.json()
+        job_ids = [str(job_id) for job_id in body["job_ids"]]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail='Body must be {"job_ids": [...]}')
+    try:
+        accepted = await request.app.state.jobs.contribute_upload(job_ids)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"accepted": accepted}
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(request: Request, job_id: str):
+    return _get_job(request, job_id).summary()
+
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(request: Request, job_id: str):
+    job = _get_job(request, job_id)
+    if job.status == FAILED:
+        raise HTTPException(status_code=422, detail=job.error)
+    if job.status != DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return jsonable_encoder({
+        "job_id": job.id,
+        "source": job.source,
+        "ledger_version": job.ledger_version,
+        "transactions": job.transactions,
+        "report": job.report,
+    })
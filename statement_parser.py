@@ -0,0 +1,416 @@
+# Statement text extraction, source detection and transaction parsing
+import io
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import streamlit as st
+import PyPDF2
+
+# Category mapping for categorization of transactions (hot-reloaded from category_mapping.json)
+from category_matching import get_matcher
+
+MONTHS = {
+    'JAN': 1, 'FEB': 2, 'MAR': 3, 'APR': 4, 'MAY': 5, 'JUN': 6,
+    'JUL': 7, 'AUG': 8, 'SEP': 9, 'OCT': 10, 'NOV': 11, 'DEC': 12
+}
+
+# Transaction headers: Paytm "DD Mon\nHH:MM AM", PhonePe a "Mon DD, YYYY" line
+PAYTM_HEADER = r"(\d{1,2} [A-Za-z]{3})\n(\d{1,2}:\d{2} [AP]M)"
+PAYTM_HEADER_PATTERN = re.compile(PAYTM_HEADER)
+PAYTM_BLOCK_PATTERN = re.compile(
+    PAYTM_HEADER + r"(.*?)(?=\d{1,2} [A-Za-z]{3}\n\d{1,2}:\d{2} [AP]M|\Z)", re.DOTALL
+)
+PHONEPE_DATE_PATTERN = re.compile(r"^[A-Za-z]{3} \d{1,2}, \d{4}$")
+
+# Statements with fewer transactions than this are parsed serially even in parallel mode
+PARALLEL_MIN_TRANSACTIONS = 20000
+
+# 📄 Extract text from PDF
+def extract_text_from_pdf(file):
+    try:
+        reader = PyPDF2.PdfReader(file)
+        text = ""
+        for page in reader.pages:
+            content = page.extract_text()
+            if content:
+                text += content + "\n"
+        return text.strip()
+    except Exception as e:
+        st.error(f"PDF Extraction Error: {e}")
+        return ""
+
+def extract_statement_period(text):
+    # Try Paytm format first
+    match = re.search(r"UPI Statement for\s+(\d{1,2} [A-Z]{3})'(\d{2})\s*-\s*(\d{1,2} [A-Z]{3})'(\d{2})", text)
+    if match:
+        start_day_month, start_year = match.group(1), match.group(2)
+        end_day_month, end_year = match.group(3), match.group(4)
+        try:
+            start_date = datetime.strptime(f"{start_day_month} 20{start_year}", "%d %b %Y")
+            end_date = datetime.strptime(f"{end_day_month} 20{end_year}", "%d %b %Y")
+            return start_date, end_date
+        except ValueError:
+            pass
+    
+    # Try PhonePe format if Paytm format not found
+    match = re.search(r"(\w{3} \d{2}, \d{4}) - (\w{3} \d{2}, \d{4})", text)
+    if match:
+        try:
+            start_date = datetime.strptime(match.group(1), "%b %d, %Y")
+            end_date = datetime.strptime(match.group(2), "%b %d, %Y")
+            return start_date, end_date
+        except ValueError:
+            pass
+    
+    return None, None
+
+def detect_statement_source(text):
+    """Detect whether the statement is from Paytm or PhonePe"""
+    if "UPI Ref No" in text and "Total Money Paid" in text:
+        return "Paytm"
+    elif "Transaction ID" in text and "UTR No" in text and "Transaction Statement for" in text:
+        return "PhonePe"
+    return "Unknown"
+
+def _phonepe_lines(text):
+    """Clean and prepare PhonePe statement lines"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return [l for l in lines if not l.startswith("Page") and "system generated" not in l.lower()]
+
+def parse_phonepe_data(text, user_id=None):
+    """Parse PhonePe transaction data using line-by-line analysis"""
+    transactions = _parse_phonepe_lines(_phonepe_lines(text), get_matcher(user_id))
+    
+    if not transactions:
+        st.error("""
+        No transactions found. Possible reasons:
+        1. The statement format doesn't match expected PhonePe format
+        2. The PDF text extraction failed
+        3. The statement is empty
+        """)
+    
+    return transactions
+
+def _parse_phonepe_lines(lines, matcher):
+    transactions = []
+    current_year = datetime.now().year
+    
+    # Enhanced patterns for matching
+    date_pattern = PHONEPE_DATE_PATTERN  # "Mar 15, 2024"
+    time_pattern = re.compile(r"\d{1,2}:\d{2} [AP]M")  # "2:30 PM"
+    amount_pattern = re.compile(r"(?:INR|Rs\.?)\s*([\d,]+\.\d{2})")  # Matches both "INR 1,234.56" and "Rs. 1234.56"
+    txn_id_pattern = re.compile(r"Transaction ID\s*:\s*(\w+)")
+    utr_pattern = re.compile(r"UTR No\s*:\s*(\w+)")
+    account_pattern = re.compile(r"(Debited from|Credited to)\s+(XX\d+|Bank Account)")
+    
+    i = 0
+    while i < len(lines):
+        if date_pattern.match(lines[i]):
+            # Start of a new transaction block
+            date_str = lines[i]
+            i += 1
+            
+            # Collect all lines until next date or end
+            block = []
+            while i < len(lines) and not date_pattern.match(lines[i]):
+                block.append(lines[i])
+                i += 1
+                
+            try:
+                # Initialize transaction fields
+                time_str = ""
+                description = ""
+                txn_id = ""
+                utr = ""
+                account = ""
+                txn_type = ""
+                amount = 0.0
+                
+                # Process block lines
+                for line in block:
+                    # Extract time if not found yet
+                    if not time_str:
+                        time_match = time_pattern.search(line)
+                        if time_match:
+                            time_str = time_match.group()
+                            
+                    # Extract transaction ID
+                    txn_id_match = txn_id_pattern.search(line)
+                    if txn_id_match and not txn_id:
+                        txn_id = txn_id_match.group(1)
+                        
+                    # Extract UTR
+                    utr_match = utr_pattern.search(line)
+                    if utr_match and not utr:
+                        utr = utr_match.group(1)
+                        
+                    # Extract account and transaction type
+                    account_match = account_pattern.search(line)
+                    if account_match and not account:
+                        txn_type = "Debit" if "Debited" in account_match.group(1) else "Credit"
+                        account = account_match.group(2)
+                        
+                    # Extract amount - enhanced to handle different formats
+                    amount_match = amount_pattern.search(line)
+                    if amount_match:
+                        amount = float(amount_match.group(1).replace(",", ""))
+                        # Force negative for debits
+                        if txn_type == "Debit":
+                            amount = -abs(amount)
+                            
+                    # Extract description (first non-metadata line)
+                    if (not description and not any(x in line for x in ["Transaction ID", "UTR No", "Debited from", "Credited to", "INR", "Rs."]) and 
+                        not time_pattern.search(line)):
+                        description = line.strip()
+                
+                # Enhanced datetime parsing with fallbacks
+                full_datetime = None
+                display_date = f"{date_str} {time_str}" if time_str else date_str
+                month_year = "Unknown"
+                
+                try:
+                    # Try parsing with current year first
+                    date_obj = datetime.strptime(f"{date_str}", "%b %d, %Y")
+                    if time_str:
+                        try:
+                            time_obj = datetime.strptime(time_str, "%I:%M %p").time()
+                        except:
+                            time_obj = datetime.strptime(time_str, "%H:%M").time()
+                        full_datetime = datetime.combine(date_obj.date(), time_obj)
+                    else:
+                        full_datetime = date_obj
+                    
+                    display_date = full_datetime.strftime("%b %d %H:%M") if time_str else full_datetime.strftime("%b %d")
+                    month_year = full_datetime.strftime("%b %Y")
+                except ValueError:
+                    try:
+                        # Fallback to current year if year is missing
+                        date_obj = datetime.strptime(f"{date_str.split(',')[0].strip()} {current_year}", "%b %d %Y")
+                        if time_str:
+                            time_obj = datetime.strptime(time_str, "%I:%M %p").time()
+                            full_datetime = datetime.combine(date_obj.date(), time_obj)
+                        else:
+                            full_datetime = date_obj
+                        display_date = full_datetime.strftime("%b %d %H:%M") if time_str else full_datetime.strftime("%b %d")
+                        month_year = full_datetime.strftime("%b %Y")
+                    except:
+                        pass
+                
+                # Categorize transaction
+                full_text = f"{description} {txn_type}".lower()
+                category, matched_keyword = matcher.match(full_text)
+                
+                # Add transaction with consistent fields
+                transaction = {
+                    "Date": display_date,
+                    "Description": description,
+                    "Amount": amount,
+                    "Category": category,
+                    "Type": txn_type,
+                    "Month_Year": month_year,
+                    "Transaction_ID": txn_id,
+                    "UTR": utr,
+                    "Matched_Keyword": matched_keyword,
+                    "Match_Text": full_text
+                }
+                
+                # Add datetime fields only if we have valid dates
+                if full_datetime:
+                    transaction["Full_Date"] = full_datetime.strftime("%Y-%m-%d %H:%M:%S") if time_str else full_datetime.strftime("%Y-%m-%d")
+                    transaction["Parsed_Date"] = full_datetime
+                else:
+                    transaction["Full_Date"] = None
+                    transaction["Parsed_Date"] = None
+                
+                transactions.append(transaction)
+                
+            except Exception as e:
+                st.warning(f"Skipping malformed transaction block: {str(e)}", icon="⚠️")
+                continue
+        else:
+            i += 1
+    
+    return transactions
+
+def _paytm_start_year(text):
+    start_date, end_date = extract_statement_period(text)
+    if not start_date or not end_date:
+        start_date = datetime.now().replace(month=1, day=1)
+        end_date = datetime.now()
+    return start_date.year
+
+def _paytm_rollover(current_year, previous_month, current_month):
+    """Advance the year when the statement wraps from December to January"""
+    if previous_month is not None and current_month < previous_month and previous_month == 12:
+        current_year += 1
+    return current_year, current_month
+
+def parse_paytm_data(text, user_id=None):
+    return _parse_paytm_blocks(text, _paytm_start_year(text), None, get_matcher(user_id))
+
+def _parse_paytm_blocks(text, current_year, previous_month, matcher):
+    transactions = []
+
+    # Improved pattern to capture amounts
+    matches = PAYTM_BLOCK_PATTERN.finditer(text)
+
+    for match in matches:
+        date_str = match.group(1).strip()
+        time_str = match.group(2).strip()
+        details = match.group(3).strip()
+
+        try:
+            day, month_abbr = date_str.split()
+            current_month = MONTHS[month_abbr.upper()]
+
+            current_year, previous_month = _paytm_rollover(current_year, previous_month, current_month)
+
+            try:
+                time_obj = datetime.strptime(time_str, "%I:%M %p").time()
+            except:
+                time_obj = datetime.strptime(time_str, "%H:%M").time()
+
+            full_datetime = datetime.combine(
+                datetime(current_year, current_month, int(day)).date(),
+                time_obj
+            )
+            display_date = full_datetime.strftime("%b %d %H:%M")
+            month_year = full_datetime.strftime("%b %Y")
+        except Exception as e:
+            full_datetime = None
+            display_date = f"{date_str} {time_str}"
+            month_year = "Unknown"
+
+        # Improved amount extraction for Paytm
+        amount_match = re.search(r"([+-])\s?Rs\.?\s?(\d+(?:,\d{3})*(?:\.\d{2})?)", details)
+        if amount_match:
+            sign = amount_match.group(1)
+            amount = float(amount_match.group(2).replace(",", ""))
+            amount = -amount if sign == "-" else amount
+        else:
+            amount = 0.0
+            
+        merchant_line = details.split("\n")[0]
+        merchant = re.sub(r"UPI Ref No:.*", "", merchant_line).strip()
+
+        # Paytm's UPI Ref No is the bank UTR for the payment
+        utr_match = re.search(r"UPI Ref No\s*:\s*(\w+)", details)
+        utr = utr_match.group(1) if utr_match else ""
+        txn_id_match = re.search(r"Transaction ID\s*:\s*(\w+)", details)
+        txn_id = txn_id_match.group(1) if txn_id_match else ""
+
+        full_text = f"{merchant} {details}".lower()
+        category, matched_keyword = matcher.match(full_text)
+
+        transactions.append({
+            "Date": display_date,
+            "Description": merchant,
+            "Amount": amount,
+            "Category": category,
+            "Full_Date": full_datetime.strftime("%Y-%m-%d %H:%M:%S") if full_datetime else None,
+            "Month_Year": month_year,
+            "Type": "Debit" if amount < 0 else "Credit",
+            "Parsed_Date": full_datetime if full_datetime else None,
+            "Transaction_ID": txn_id,
+            "UTR": utr,
+            "Matched_Keyword": matched_keyword,
+            "Match_Text": full_text
+        })
+    
+    return transactions
+
+def _shard_bounds(starts, end, shard_count):
+    """Group transaction start offsets into at most shard_count contiguous shards"""
+    step = -(-len(starts) // shard_count)
+    first = list(range(0, len(starts), step))
+    return [(starts[i], starts[i + step] if i + step < len(starts) else end, i) for i in first]
+
+def _parse_paytm_shard(args):
+    return _parse_paytm_blocks(*args)
+
+def _parse_phonepe_shard(args):
+    return _parse_phonepe_lines(*args)
+
+def _map_shards(func, shards, workers):
+    # "spawn" avoids forking the multi-threaded Streamlit server
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        results = pool.map(func, shards)
+        return [transaction for shard in results for transaction in shard]
+
+def parse_paytm_data_parallel(text, user_id=None, workers=None):
+    """Parse a Paytm statement in a process pool; output matches parse_paytm_data.
+
+    The text is cut at transaction headers, and the year/month rollover
+    state each shard starts with is replayed from the headers alone, so
+    every shard sees exactly the state the serial parser would have.
+    """
+    workers = workers or os.cpu_count() or 1
+    matcher = get_matcher(user_id)
+    current_year = _paytm_start_year(text)
+    headers = list(PAYTM_HEADER_PATTERN.finditer(text))
+    if workers < 2 or len(headers) < PARALLEL_MIN_TRANSACTIONS:
+        return _parse_paytm_blocks(text, current_year, None, matcher)
+
+    shards = []
+    previous_month = None
+    header_index = 0
+    for start, end, first in _shard_bounds([h.start() for h in headers], len(text), workers * 4):
+        # Replay the rollover logic up to this shard's first header
+        for header in headers[header_index:first]:
+            month = MONTHS.get(header.group(1).split()[1].upper())
+            if month is not None:
+                current_year, previous_month = _paytm_rollover(current_year, previous_month, month)
+        header_index = first
+        shards.append((text[start:end], current_year, previous_month, matcher))
+    return _map_shards(_parse_paytm_shard, shards, workers)
+
+def parse_phonepe_data_parallel(text, user_id=None, workers=None):
+    """Parse a PhonePe statement in a process pool; output matches parse_phonepe_data"""
+    workers = workers or os.cpu_count() or 1
+    matcher = get_matcher(user_id)
+    lines = _phonepe_lines(text)
+    starts = [i for i, line in enumerate(lines) if PHONEPE_DATE_PATTERN.match(line)]
+    if workers < 2 or len(starts) < PARALLEL_MIN_TRANSACTIONS:
+        transactions = _parse_phonepe_lines(lines, matcher)
+    else:
+        shards = [(lines[start:end], matcher) for start, end, _ in _shard_bounds(starts, len(lines), workers * 4)]
+        transactions = _map_shards(_parse_phonepe_shard, shards, workers)
+
+    if not transactions:
+        st.error("""
+        No transactions found. Possible reasons:
+        1. The statement format doesn't match expected PhonePe format
+        2. The PDF text extraction failed
+        3. The statement is empty
+        """)
+    return transactions
+
+def parse_statement(text, source, user_id=None, workers=None):
+    """Parse statement text with the parser for its detected source.
+
+    With workers > 1, large statements are split at transaction boundaries
+    and parsed in a process pool.
+    """
+    if source == "Paytm":
+        if workers and workers > 1:
+            return parse_paytm_data_parallel(text, user_id, workers)
+        return parse_paytm_data(text, user_id)
+    elif source == "PhonePe":
+        if workers and workers > 1:
+            return parse_phonepe_data_parallel(text, user_id, workers)
+        return parse_phonepe_data(text, user_id)
+    return []
+
+def parse_pdf_bytes(pdf_bytes, user_id=None):
+    """Extract, detect and parse a PDF given as raw bytes.
+
+    Module-level so it can run inside a process pool worker.
+    """
+    text = extract_text_from_pdf(io.BytesIO(pdf_bytes))
+    source = detect_statement_source(text) if text else "Unknown"
+    transactions = parse_statement(text, source, user_id)
+    return text, source, transactions
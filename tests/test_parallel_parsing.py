@@ -0,0 +1,84 @@
+# The parallel parsers must return exactly what the serial parsers return
+import random
+
+import pytest
+
+import statement_parser
+from statement_parser import (
+    parse_paytm_data,
+    parse_paytm_data_parallel,
+    parse_phonepe_data,
+    parse_phonepe_data_parallel,
+)
+
+MERCHANTS = ["Swiggy", "Zomato", "Irctc", "Apollo Pharmacy", "Jio Recharge", "Amazon", "Rahul Kumar"]
+MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def _paytm_statement(count, seed=0):
+    """Paytm text running Nov 2023 onwards, so it crosses a year boundary, with some bad dates mixed in."""
+    rng = random.Random(seed)
+    lines = ["UPI Statement for 01 NOV'23 - 28 FEB'25", "Total Money Paid Rs.1,00,000"]
+    month = 10  # index into MONTH_NAMES
+    for i in range(count):
+        if i and i % (count // 16 or 1) == 0:
+            month = (month + 1) % 12
+        day = rng.randint(1, 28)
+        month_name = MONTH_NAMES[month]
+        if i % 97 == 0:
+            month_name = "Xyz"  # unknown month: no date, rollover state untouched
+        elif i % 89 == 0:
+            day = 31 if MONTH_NAMES[month] == "Feb" else 32  # invalid day: rollover still applied
+        sign = "-" if rng.random() < 0.8 else "+"
+        lines += [
+            f"{day} {month_name}",
+            f"{rng.randint(1, 12)}:{rng.randint(0, 59):02d} {rng.choice(['AM', 'PM'])}",
+            f"Paid to {rng.choice(MERCHANTS)} UPI Ref No: {100000 + i}",
+            f"Transaction ID : T{i}",
+            f"{sign} Rs.{rng.randint(1, 5000)}.{rng.randint(0, 99):02d}",
+        ]
+    return "\n".join(lines)
+
+
+def _phonepe_statement(count, seed=0):
+    rng = random.Random(seed)
+    lines = ["Transaction Statement for Jan 01, 2024 - Dec 31, 2024"]
+    for i in range(count):
+        if i % 40 == 0:
+            lines.append(f"Page {i // 40 + 1} of {count // 40 + 1}")
+        debit = rng.random() < 0.8
+        lines += [
+            f"{rng.choice(MONTH_NAMES)} {rng.randint(1, 28):02d}, 2024",
+            f"{rng.randint(1, 12)}:{rng.randint(0, 59):02d} {rng.choice(['AM', 'PM'])}",
+            f"{'Paid to' if debit else 'Received from'} {rng.choice(MERCHANTS)}",
+            f"Transaction ID : T{i}",
+            f"UTR No : {200000 + i}",
+            f"{'Debited from' if debit else 'Credited to'} XX{rng.randint(1000, 9999)}",
+            f"INR {rng.randint(1, 5000):,}.{rng.randint(0, 99):02d}",
+        ]
+    lines.append("This is a system generated statement")
+    return "\n".join(lines)
+
+
+@pytest.fixture(autouse=True)
+def small_parallel_threshold(monkeypatch):
+    # Force the process pool path (and many shard boundaries) on small statements
+    monkeypatch.setattr(statement_parser, "PARALLEL_MIN_TRANSACTIONS", 1)
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_paytm_parallel_matches_serial(workers):
+    text = _paytm_statement(1500)
+    serial = parse_paytm_data(text)
+    assert len(serial) == 1500
+    assert any(t["Parsed_Date"] is None for t in serial)
+    assert len({t["Parsed_Date"].year for t in serial if t["Parsed_Date"]}) > 1
+    assert parse_paytm_data_parallel(text, workers=workers) == serial
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_phonepe_parallel_matches_serial(workers):
+    text = _phonepe_statement(1200)
+    serial = parse_phonepe_data(text)
+    assert len(serial) == 1200
+    assert parse_phonepe_data_parallel(text, workers=workers) == serial
@@ -0,0 +1,74 @@
+# Cross-statement reconciliation and how its self-transfers are aggregated
+from datetime import datetime, timedelta
+
+from forecasting import spending_matrix
+from reconcile import reconcile_statements
+from report_generator import build_offline_report
+
+T0 = datetime(2024, 3, 5, 10, 0)
+
+
+def _row(amount, minutes=0, utr=None, description="Swiggy", category="Food"):
+    return {
+        "Parsed_Date": T0 + timedelta(minutes=minutes),
+        "Description": description,
+        "Amount": amount,
+        "Type": "Debit" if amount < 0 else "Credit",
+        "Category": category,
+        "UTR": utr,
+    }
+
+
+def test_utr_hash_join_merges_the_same_payment():
+    paytm = [_row(-250.0, utr="412345678901", description="")]
+    phonepe = [_row(-250.0, minutes=45, utr="412345678901")]  # outside the window: only the UTR matches
+    ledger, stats = reconcile_statements([("Paytm", paytm), ("PhonePe", phonepe)])
+    assert stats["utr_matches"] == 1 and stats["duplicates_removed"] == 1
+    assert len(ledger) == 1
+    assert ledger[0]["Source"] == "Paytm + PhonePe"
+    assert ledger[0]["Description"] == "Swiggy"  # gap filled from the other statement
+
+
+def test_utr_pair_in_opposite_directions_is_a_self_transfer():
+    paytm = [_row(-5000.0, utr="998877", category="Transfer")]
+    phonepe = [_row(5000.0, minutes=1, utr="998877", category="Other")]
+    ledger, stats = reconcile_statements([("Paytm", paytm), ("PhonePe", phonepe)])
+    assert stats["self_transfers"] == 1 and stats["duplicates_removed"] == 0
+    assert len(ledger) == 2
+    assert all(row["Self_Transfer"] and row["Category"] == "Transfer" for row in ledger)
+
+
+def test_window_fallback_matches_amount_and_time_without_utr():
+    paytm = [_row(-120.0), _row(-120.0, minutes=60)]
+    phonepe = [_row(-120.0, minutes=4), _row(-120.0, minutes=60 + 11)]  # second one is outside the window
+    ledger, stats = reconcile_statements([("Paytm", paytm), ("PhonePe", phonepe)])
+    assert stats["utr_matches"] == 0
+    assert stats["fallback_matches"] == 1
+    assert len(ledger) == 3
+
+
+def test_fallback_skips_pairs_with_different_utrs():
+    paytm = [_row(-120.0, utr="111")]
+    phonepe = [_row(-120.0, minutes=1, utr="222")]
+    ledger, stats = reconcile_statements([("Paytm", paytm), ("PhonePe", phonepe)])
+    assert stats["fallback_matches"] == 0 and len(ledger) == 2
+
+
+def test_rows_from_the_same_statement_are_never_matched():
+    # Two identical coffees in one statement are two payments, even with a repeated UTR
+    paytm = [_row(-80.0, utr="555"), _row(-80.0, minutes=2, utr="555"), _row(-80.0, minutes=3)]
+    ledger, stats = reconcile_statements([("Paytm", paytm)])
+    assert stats["utr_matches"] == stats["fallback_matches"] == 0
+    assert len(ledger) == 3
+
+
+def test_self_transfers_are_left_out_of_totals():
+    paytm = [_row(-5000.0, utr="998877", category="Transfer"), _row(-300.0, minutes=30, utr="1")]
+    phonepe = [_row(5000.0, minutes=1, utr="998877")]
+    ledger, _ = reconcile_statements([("Paytm", paytm), ("PhonePe", phonepe)])
+
+    categories, _, matrix = spending_matrix(ledger)
+    assert categories == ["Food"] and matrix.tolist() == [[300.0]]
+    report = build_offline_report(ledger)
+    assert "Money in: **₹0.00**, money out: **₹300.00**" in report
+    assert "2 transfers between your own accounts" in report
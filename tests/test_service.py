@@ -0,0 +1,123 @@
+# Job lifecycle of the analysis service, driven through its HTTP API with the stub LLM
+import functools
+import os
+import signal
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import service
+from benchmarks import BenchmarkStore
+from report_generator import STUB_API_KEY
+
+
+def _pdf(lines):
+    """A one-page PDF showing `lines` as text, enough for the statement parsers."""
+    def escape(line):
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({escape(line)}) '" for line in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R"
+        " /Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf, offsets = "%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return pdf.encode("latin-1")
+
+
+def _paytm_pdf(count=5, first_ref=400000):
+    lines = ["UPI Statement for 01 JAN'24 - 31 JAN'24", "Total Money Paid Rs.500"]
+    for i in range(count):
+        lines += [f"{i + 1} Jan", "1:00 PM", f"Paid to Zomato {i}", f"UPI Ref No: {first_ref + i}",
+                  f"- Rs.{100 + i}.00"]
+    return _pdf(lines)
+
+
+def _wait(client, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client.get(f"/jobs/{job_id}").json()
+        if status["status"] in (service.DONE, service.FAILED):
+            return status
+        assert time.monotonic() < deadline, f"job still {status['status']}"
+        time.sleep(0.1)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(service, "JobManager", functools.partial(
+        service.JobManager, parse_workers=2, max_queued=2, benchmarks=BenchmarkStore(None)
+    ))
+    with TestClient(service.app) as client:
+        yield client
+
+
+def test_statement_job_submit_poll_result(client):
+    response = client.post("/jobs", content=_paytm_pdf(), headers={"X-Gemini-Api-Key": STUB_API_KEY})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    status = _wait(client, job_id)
+    assert status["status"] == service.DONE
+    assert status["source"] == "Paytm" and status["transaction_count"] == 5
+
+    result = client.get(f"/jobs/{job_id}/result").json()
+    assert [t["Amount"] for t in result["transactions"]] == [-100.0, -101.0, -102.0, -103.0, -104.0]
+    assert result["report"].startswith("## Financial Analysis Report (stub)")
+
+
+def test_report_job_submit_poll_result(client):
+    response = client.post("/reports", content=b"Date | Description | Amount\n2024-01-01 | Zomato | -100",
+                           headers={"X-Gemini-Api-Key": STUB_API_KEY})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert _wait(client, job_id)["status"] == service.DONE
+    assert "Statement lines reviewed: 2" in client.get(f"/jobs/{job_id}/result").json()["report"]
+
+
+def test_unreadable_statement_fails_the_job(client):
+    job_id = client.post("/jobs", content=b"not a pdf").json()["job_id"]
+    assert _wait(client, job_id)["status"] == service.FAILED
+    assert client.get(f"/jobs/{job_id}/result").status_code == 422
+
+
+def test_reports_count_against_the_queue_bound(client, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(service, "analyze_financial_data", lambda text, api_key: release.wait(30) and "report")
+    headers = {"X-Gemini-Api-Key": STUB_API_KEY}
+    job_ids = [client.post("/reports", content=b"text", headers=headers).json()["job_id"] for _ in range(2)]
+
+    assert client.post("/reports", content=b"text", headers=headers).status_code == 503
+    assert client.post("/jobs", content=_paytm_pdf()).status_code == 503
+
+    release.set()
+    assert all(_wait(client, job_id)["status"] == service.DONE for job_id in job_ids)
+    assert client.post("/reports", content=b"text", headers=headers).status_code == 202
+
+
+def test_pool_is_replaced_after_a_parse_process_dies(client):
+    assert _wait(client, client.post("/jobs", content=_paytm_pdf()).json()["job_id"])["status"] == service.DONE
+    manager = client.app.state.jobs
+    broken = manager._process_pool
+    for process in list(broken._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+
+    status = _wait(client, client.post("/jobs", content=_paytm_pdf(first_ref=500000)).json()["job_id"])
+    assert status["status"] == service.FAILED and "parse process died" in status["error"]
+    assert manager._process_pool is not broken
+
+    status = _wait(client, client.post("/jobs", content=_paytm_pdf(first_ref=600000)).json()["job_id"])
+    assert status["status"] == service.DONE
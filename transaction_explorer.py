@@ -0,0 +1,168 @@
+# Server-side filtering, sorting and pagination for the Transactions page
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+# Sentinel that sorts rows without a parsed date after every real timestamp
+_NO_DATE = np.iinfo(np.int64).max
+
+DISPLAY_COLUMNS = ["Date", "Description", "Amount", "Category", "Type", "Month_Year", "Source"]
+SORTABLE_COLUMNS = ["Date", "Amount", "Description", "Category"]
+
+
+def _to_ns(value):
+    return pd.Timestamp(value).value
+
+
+class TransactionIndex:
+    """Precomputed indexes over a parsed ledger.
+
+    Rows are stored once in date order so a date range is a contiguous slice
+    found with binary search. Category and type filters are answered from
+    per-value bitmaps, text search from the distinct descriptions only, and
+    sorting from orders computed at build time. A query therefore never
+    sorts or scans strings row by row, and only one page is materialized.
+    """
+
+    def __init__(self, transactions):
+        df = transactions if isinstance(transactions, pd.DataFrame) else pd.DataFrame(transactions)
+        df = df.reset_index(drop=True)
+        for column in ("Description", "Category", "Type"):
+            if column not in df.columns:
+                df[column] = ""
+        if "Amount" not in df.columns:
+            df["Amount"] = 0.0
+
+        if "Parsed_Date" in df.columns:
+            parsed = pd.to_datetime(df["Parsed_Date"], errors="coerce")
+        elif "Full_Date" in df.columns:
+            parsed = pd.to_datetime(df["Full_Date"], errors="coerce")
+        else:
+            parsed = pd.Series(pd.NaT, index=df.index)
+        dates = parsed.to_numpy(dtype="datetime64[ns]").view(np.int64).copy()
+        dates[parsed.isna().to_numpy()] = _NO_DATE
+
+        # Store rows in date order; the sorted date array is the date index
+        order = np.argsort(dates, kind="stable")
+        self.frame = df.iloc[order].reset_index(drop=True)
+        self._dates = dates[order]
+        self._dated_rows = int(np.searchsorted(self._dates, _NO_DATE, side="left"))
+        self._amounts = pd.to_numeric(self.frame["Amount"], errors="coerce").fillna(0.0).to_numpy()
+        self._abs_amounts = np.abs(self._amounts)
+
+        # Category / type bitmaps
+        category_codes, categories = pd.factorize(self.frame["Category"].fillna("Other"))
+        type_codes, types = pd.factorize(self.frame["Type"].fillna(""))
+        self.categories = sorted(categories)
+        self.types = sorted(t for t in types if t)
+        self._category_bitmaps = {c: category_codes == i for i, c in enumerate(categories)}
+        self._type_bitmaps = {t: type_codes == i for i, t in enumerate(types)}
+
+        # Text search runs over distinct descriptions, not over every row
+        description_codes, descriptions = pd.factorize(self.frame["Description"].fillna("").astype(str))
+        self._description_codes = description_codes
+        self._descriptions_lower = [d.lower() for d in descriptions]
+
+        # Precomputed sort orders (Date order is the storage order itself)
+        self._sort_orders = {
+            "Amount": np.argsort(self._amounts, kind="stable"),
+            "Description": self._order_by_codes(description_codes, descriptions),
+            "Category": self._order_by_codes(category_codes, categories),
+        }
+
+    @staticmethod
+    def _order_by_codes(codes, uniques):
+        ranks = np.empty(len(uniques), dtype=np.int64)
+        ranks[np.argsort(np.asarray(uniques, dtype=object).astype(str))] = np.arange(len(uniques))
+        return np.argsort(ranks[codes], kind="stable")
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def date_bounds(self):
+        """First and last transaction date, or (None, None) if nothing is dated."""
+        if self._dated_rows == 0:
+            return None, None
+        return (pd.Timestamp(self._dates[0]).date(),
+                pd.Timestamp(self._dates[self._dated_rows - 1]).date())
+
+    def _date_slice(self, start, end):
+        if start is None and end is None:
+            return 0, len(self.frame)
+        lo = 0 if start is None else int(np.searchsorted(self._dates[:self._dated_rows], _to_ns(start), side="left"))
+        if end is None:
+            hi = self._dated_rows
+        elif isinstance(end, dt.date) and not isinstance(end, dt.datetime):
+            # A plain date means "through the end of that day"
+            hi = int(np.searchsorted(self._dates[:self._dated_rows], _to_ns(end + dt.timedelta(days=1)), side="left"))
+        else:
+            hi = int(np.searchsorted(self._dates[:self._dated_rows], _to_ns(end), side="right"))
+        return lo, max(lo, hi)
+
+    def filter(self, start=None, end=None, categories=None, types=None,
+               min_amount=None, max_amount=None, search=None):
+        """Return the positions of matching rows, in date order.
+
+        Rows without a parsed date are only included when no date bound is
+        given. min_amount / max_amount bound the absolute amount, so a debit
+        of -500 matches min_amount=100.
+        """
+        lo, hi = self._date_slice(start, end)
+        mask = np.ones(hi - lo, dtype=bool)
+
+        if categories:
+            selected = np.zeros(hi - lo, dtype=bool)
+            for category in categories:
+                bitmap = self._category_bitmaps.get(category)
+                if bitmap is not None:
+                    selected |= bitmap[lo:hi]
+            mask &= selected
+        if types:
+            selected = np.zeros(hi - lo, dtype=bool)
+            for txn_type in types:
+                bitmap = self._type_bitmaps.get(txn_type)
+                if bitmap is not None:
+                    selected |= bitmap[lo:hi]
+            mask &= selected
+
+        if min_amount is not None:
+            mask &= self._abs_amounts[lo:hi] >= min_amount
+        if max_amount is not None:
+            mask &= self._abs_amounts[lo:hi] <= max_amount
+
+        if search:
+            term = search.strip().lower()
+            if term:
+                matching = np.fromiter((term in d for d in self._descriptions_lower),
+                                       dtype=bool, count=len(self._descriptions_lower))
+                mask &= matching[self._description_codes[lo:hi]]
+
+        return np.flatnonzero(mask) + lo
+
+    def sort(self, rows, by="Date", ascending=True):
+        """Reorder filtered row positions using the precomputed sort orders."""
+        if by not in self._sort_orders:
+            ordered = rows
+        elif len(rows) == len(self.frame):
+            ordered = self._sort_orders[by]
+        else:
+            member = np.zeros(len(self.frame), dtype=bool)
+            member[rows] = True
+            order = self._sort_orders[by]
+            ordered = order[member[order]]
+        return ordered if ascending else ordered[::-1]
+
+    def page(self, rows, page=1, page_size=50, columns=None):
+        """Materialize a single page of rows as a DataFrame."""
+        start = max(page - 1, 0) * page_size
+        frame = self.frame.iloc[rows[start:start + page_size]]
+        if columns:
+            frame = frame[[c for c in columns if c in frame.columns]]
+        return frame
+
+    def query(self, page=1, page_size=50, sort_by="Date", ascending=True, columns=None, **filters):
+        """Filter, sort and paginate in one call. Returns (page_df, total_matches)."""
+        rows = self.sort(self.filter(**filters), by=sort_by, ascending=ascending)
+        return self.page(rows, page, page_size, columns), len(rows)